@@ -0,0 +1,266 @@
+from collections import namedtuple
+import argparse
+import json
+import os
+import platform
+import time
+import tracemalloc
+
+from intcode import (
+    Analysis, BatchProgram, CompiledProgram, MemoizingProgram, ProfilingProgram,
+    Program, TracingProgram, assemble, load_input,
+)
+from intcode.batch import np
+
+
+# drive(make, memory) runs the workload to completion and returns its
+# outputs, calling make(memory) for every program it needs. batch, if set,
+# runs the same workload with a BatchProgram instead.
+Workload = namedtuple('Workload', ['name', 'memory', 'drive', 'batch'])
+
+ENGINES = {
+    'interpreter': Program,
+    'compiled': CompiledProgram,
+    'compiled+analysis': lambda memory: CompiledProgram(memory, analysis=Analysis(memory)),
+    'profiling': ProfilingProgram,
+    'tracing': TracingProgram,
+    'tracing sampled': lambda memory: TracingProgram(memory, sample=16),
+    'memoizing': MemoizingProgram,
+}
+
+
+def run_to_end(*inputs):
+    def drive(make, memory):
+        return make(memory).run(inputs)
+    return drive
+
+
+COUNT_LOOP = '''
+    loop: add [i] 1 [i]
+          lt [i] {n} [flag]
+          jnz [flag] loop
+          out [i]
+          halt
+    i:    data 0
+    flag: data 0
+'''
+
+SQUARES_LOOP = '''
+    loop: mul [i] [i] [square]
+          add [total] [square] [total]
+          add [i] 1 [i]
+          lt [i] {n} [flag]
+          jnz [flag] loop
+          out [total]
+          halt
+    i:      data 0
+    square: data 0
+    total:  data 0
+    flag:   data 0
+'''
+
+# Naive recursive Fibonacci. Each frame is the return address, n, the
+# result and one local, and calls use the usual push and jump idiom.
+FIBONACCI = '''
+          arb stack
+          in [rb+1]
+          add done 0 [rb+0]
+          jz 0 fib
+    done: out [rb+2]
+          halt
+
+    fib:  lt [rb+1] 2 [rb+3]
+          jz [rb+3] recurse
+          add [rb+1] 0 [rb+2]
+          jz 0 [rb+0]
+    recurse:
+          arb 4
+          add [rb-3] -1 [rb+1]
+          add first 0 [rb+0]
+          jz 0 fib
+    first:
+          add [rb+2] 0 [rb-1]
+          add [rb-3] -2 [rb+1]
+          add second 0 [rb+0]
+          jz 0 fib
+    second:
+          add [rb-1] [rb+2] [rb-2]
+          arb -4
+          jz 0 [rb+0]
+    stack: data 0
+'''
+
+ECHO = '''
+    loop: in [x]
+          jz [x] end
+          out [x]
+          jz 0 loop
+    end:  halt
+    x:    data 0
+'''
+
+# Adds an immediate to total that the loop itself increments every time
+SELF_MODIFYING = '''
+    loop: add 0 [total] [total]
+          add [loop+1] 1 [loop+1]
+          lt [loop+1] {n} [flag]
+          jnz [flag] loop
+          out [total]
+          halt
+    total: data 0
+    flag:  data 0
+'''
+
+
+def echo_values(n):
+    # One value in and one out at a time, as an interactive host would
+    def drive(make, memory):
+        program = make(memory)
+        outputs = []
+        for value in range(1, n + 1):
+            outputs += program.run([value])
+        program.run([0])
+        return outputs
+    return drive
+
+
+def synthetic_workloads(scale):
+    return [
+        Workload('count_loop', assemble(COUNT_LOOP.format(n=200_000 * scale)), run_to_end(), None),
+        Workload('squares_loop', assemble(SQUARES_LOOP.format(n=50_000 * scale)), run_to_end(), None),
+        Workload('fibonacci', assemble(FIBONACCI), run_to_end(17 + scale), None),
+        Workload('echo', assemble(ECHO), echo_values(20_000 * scale), None),
+        Workload('self_modifying', assemble(SELF_MODIFYING.format(n=20_000 * scale)), run_to_end(), None),
+    ]
+
+
+def play_breakout(make, memory):
+    memory = list(memory)
+    memory[0] = 2
+    program = make(memory)
+    ball = paddle = score = 0
+    while True:
+        outputs = program.run_until_blocked()
+        for x, y, tile in zip(outputs[::3], outputs[1::3], outputs[2::3]):
+            if x == -1:
+                score = tile
+            elif tile == 3:
+                paddle = x
+            elif tile == 4:
+                ball = x
+        if program.halted:
+            return [score]
+        program.feed([(ball > paddle) - (ball < paddle)])
+
+
+def scan_beam(make, memory):
+    return [make(memory).run([x, y])[0] for x in range(50) for y in range(50)]
+
+
+def scan_beam_batch(memory):
+    probes = [(x, y) for x in range(50) for y in range(50)]
+    return [outputs[0] for outputs in BatchProgram(memory, len(probes), probes).run()]
+
+
+def day_workloads():
+    days = [
+        (5, run_to_end(5), None),
+        (9, run_to_end(2), None),
+        (13, play_breakout, None),
+        (17, run_to_end(), None),
+        (19, scan_beam, scan_beam_batch),
+    ]
+    workloads = []
+    for day, drive, batch in days:
+        path = f'../input/day_{day}.in'
+        if os.path.exists(path):
+            workloads.append(Workload(f'day_{day}', load_input(path).values(), drive, batch))
+        else:
+            print(f'Skipping day_{day}, no input at {path}')
+    return workloads
+
+
+# Instructions run by the workload, counted once with the profiling engine
+def count_instructions(workload):
+    programs = []
+    def make(memory):
+        programs.append(ProfilingProgram(memory))
+        return programs[-1]
+    outputs = workload.drive(make, workload.memory)
+    return sum(sum(program.op_counts.values()) for program in programs), outputs
+
+
+def measure(run, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        outputs = run()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return outputs, best, peak
+
+
+def run_suite(workloads, engines, repeat):
+    results = []
+    for workload in workloads:
+        instructions, expected = count_instructions(workload)
+
+        runs = [(name, lambda engine=engine: workload.drive(engine, workload.memory)) for name, engine in engines.items()]
+        if workload.batch is not None and np is not None:
+            runs.append(('batch', lambda: workload.batch(workload.memory)))
+
+        for name, run in runs:
+            outputs, seconds, peak = measure(run, repeat)
+            if outputs != expected:
+                raise Exception(f'{name} gave different outputs on {workload.name}')
+            results.append({
+                'workload': workload.name,
+                'engine': name,
+                'instructions': instructions,
+                'seconds': seconds,
+                'instructions_per_second': instructions / seconds,
+                'peak_bytes': peak,
+            })
+            print(f'{workload.name:>16} {name:>18} {seconds:9.4f}s {instructions / seconds / 1e6:9.2f} Minstr/s {peak / 1024:9.0f} KiB')
+    return results
+
+
+def compare(results, baseline):
+    before = {(result['workload'], result['engine']): result['seconds'] for result in baseline['results']}
+    for result in results:
+        key = (result['workload'], result['engine'])
+        if key in before:
+            print(f'{key[0]:>16} {key[1]:>18} {before[key] / result["seconds"]:6.2f}x')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the Intcode engines')
+    parser.add_argument('--engines', nargs='*', choices=list(ENGINES), default=list(ENGINES))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--scale', type=int, default=1)
+    parser.add_argument('--no-days', action='store_true')
+    parser.add_argument('--output', default='../output/benchmark.json')
+    parser.add_argument('--compare', help='earlier results to compare against')
+    args = parser.parse_args()
+
+    workloads = synthetic_workloads(args.scale)
+    if not args.no_days:
+        workloads += day_workloads()
+    results = run_suite(workloads, {name: ENGINES[name] for name in args.engines}, args.repeat)
+
+    with open(args.output, 'w') as f:
+        json.dump({
+            'time': time.time(),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'results': results,
+        }, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
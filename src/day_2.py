@@ -1,5 +1,7 @@
 from copy import copy
 
+from intcode import BatchProgram, load_input
+
 
 ADD = 1
 MULTIPLY = 2
@@ -29,18 +31,130 @@ def run_program(program, noun, verb):
     execute(memory, 0)
     return memory[0]
 
+# Values in the symbolic run are polynomials in the noun and verb, stored as
+# {(noun power, verb power): coefficient}. None stands for a value that
+# cannot be known without concrete inputs, such as a read from an address
+# that depends on the noun or verb.
+CONSTANT = (0, 0)
+NOUN = (1, 0)
+VERB = (0, 1)
+
+
+def poly_add(a, b):
+    result = dict(a)
+    for term, coeff in b.items():
+        result[term] = result.get(term, 0) + coeff
+    return {term: coeff for term, coeff in result.items() if coeff}
+
+
+def poly_mul(a, b):
+    result = {}
+    for (n1, v1), c1 in a.items():
+        for (n2, v2), c2 in b.items():
+            term = (n1 + n2, v1 + v2)
+            result[term] = result.get(term, 0) + c1 * c2
+    return {term: coeff for term, coeff in result.items() if coeff}
+
+
+def constant(poly):
+    if poly is None or any(term != CONSTANT for term in poly):
+        return None
+    return poly.get(CONSTANT, 0)
+
+
+# Runs the program once with the noun and verb left as unknowns and returns
+# memory[0] as a polynomial, or None if the run depends on them in a way
+# that cannot be followed symbolically
+def symbolic_execute(program):
+    memory = [{CONSTANT: value} if value else {} for value in program]
+    memory[1] = {NOUN: 1}
+    memory[2] = {VERB: 1}
+
+    position = 0
+    while position + 4 <= len(memory):
+        op, r1, r2, out = map(constant, memory[position:position+4])
+        if op == EXIT:
+            return memory[0]
+        if op not in (ADD, MULTIPLY) or out is None or not 0 <= out < len(memory):
+            return None
+
+        values = []
+        for address in (r1, r2):
+            if address is None:
+                values.append(None)
+            elif 0 <= address < len(memory):
+                values.append(memory[address])
+            else:
+                return None
+        v1, v2 = values
+
+        if v1 is None or v2 is None:
+            memory[out] = None
+        elif op == ADD:
+            memory[out] = poly_add(v1, v2)
+        else:
+            memory[out] = poly_mul(v1, v2)
+        position += 4
+
+    return None
+
+
+# Solves for every noun and verb giving target, or returns None if the
+# program's output is not linear in them
+def solve(program, target):
+    result = symbolic_execute(program)
+    if result is None or any(n + v > 1 for n, v in result):
+        return None
+
+    c = result.get(CONSTANT, 0)
+    a = result.get(NOUN, 0)
+    b = result.get(VERB, 0)
+    candidates = []
+    for noun in range(0, 100):
+        rest = target - c - a * noun
+        if b == 0:
+            if rest == 0:
+                candidates += [(noun, verb) for verb in range(0, 100)]
+        elif rest % b == 0 and 0 <= rest // b < 100:
+            candidates.append((noun, rest // b))
+
+    # Values read through noun or verb dependent addresses were assumed not
+    # to matter, so confirm each answer with a real run
+    solutions = []
+    for noun, verb in candidates:
+        try:
+            if run_program(program, noun, verb) == target:
+                solutions.append((noun, verb))
+        except Exception:
+            pass
+    return solutions
+
+
+def search(program, target):
+    # Run every noun and verb pair at once, one lane each
+    pairs = [(noun, verb) for noun in range(0, 100) for verb in range(0, 100)]
+    batch = BatchProgram(program, len(pairs))
+    batch.memory[:, 1] = [noun for noun, _ in pairs]
+    batch.memory[:, 2] = [verb for _, verb in pairs]
+    batch.run()
+
+    solutions = []
+    for (noun, verb), result, failed in zip(pairs, batch.memory[:, 0], batch.failed):
+        if failed:
+            print(f'{noun}, {verb}: Exception')
+        elif result == target:
+            solutions.append((noun, verb))
+    return solutions
+
+
 if __name__ == "__main__":
-    with open('../input/day_2.in') as f:
-        program = list(map(int, f.readline().split(',')))
+    program = load_input('../input/day_2.in').values()
 
     print(run_program(program, 12, 2))
 
-    for noun in range(0, 100):
-        for verb in range(0, 100):
-            try:
-                result = run_program(program, noun, verb)
-                if result == 19690720:
-                    print('SUCCESS!', 100 * noun + verb)
-            except:
-                print(f'{noun}, {verb}: Exception')
-                pass
+    solutions = solve(program, 19690720)
+    if solutions is None:
+        solutions = search(program, 19690720)
+
+    for noun, verb in solutions:
+        print('SUCCESS!', 100 * noun + verb)
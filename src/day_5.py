@@ -1,131 +1,17 @@
-from copy import copy
-from operator import add, mul, eq, lt
-from dataclasses import dataclass
+from intcode import ResultCache, load_input
 
-ADD = 1
-MULTIPLY = 2
-INPUT = 3
-OUTPUT = 4
-JUMP_IF_TRUE = 5
-JUMP_IF_FALSE = 6
-LESS_THAN = 7
-EQUALS = 8
-EXIT = 99
 
-POSITION_MODE = 0
-IMMEDIATE_MODE = 1
-
-
-NO_PARAM = {EXIT}
-ONE_PARAM = {INPUT, OUTPUT}
-TWO_PARAM = {JUMP_IF_TRUE, JUMP_IF_FALSE}
-THREE_PARAM = {ADD, MULTIPLY, LESS_THAN, EQUALS}
-
-
-@dataclass
-class Param:
-    value: int
-    mode: int
-
-
-class Program:
-    def __init__(self, memory, input):
-        self.memory = copy(memory)
-        self.position = 0
-        self.input = input
-
-
-    def _read_memory(self):
-        result = self.memory[self.position]
-        self.position += 1
-        return result
-
-
-    def consume(self):
-        raw_op = self._read_memory()
-
-        op = raw_op % 100
-        if op in THREE_PARAM:
-            param_count = 3
-        elif op in TWO_PARAM:
-            param_count = 2
-        elif op in ONE_PARAM:
-            param_count = 1
-        elif op in NO_PARAM:
-            param_count = 0
-        else:
-            raise Exception(f'Do not know how many params for {op}')
-        
-        values = [self._read_memory() for _ in range(param_count)]
-        modes = reversed(list(map(int, str(raw_op // 100).zfill(param_count))))
-
-        params = [Param(param, mode) for (param, mode) in zip(values, modes)]
-        return (op, params)
-
-
-    def read(self, param):
-        if param.mode == IMMEDIATE_MODE:
-            return param.value
-        if param.mode == POSITION_MODE:
-            return self.memory[param.value]
-        raise Exception(f'Do not know how to interprete mode {param.mode}')
-    
-
-    def write(self, param, value):
-        if param.mode == IMMEDIATE_MODE:
-            raise Exception(f'Tried to write to {param}')
-        self.memory[param.value] = value
-
-
-    def execute(self):
-        op, params = self.consume()
-        while op != EXIT:
-            if op == ADD or op == MULTIPLY or op == LESS_THAN or op == EQUALS:
-                r1, r2, out = params
-                if op == ADD:
-                    ex = add
-                elif op == MULTIPLY:
-                    ex = mul
-                elif op == LESS_THAN:
-                    ex = lt
-                elif op == EQUALS:
-                    ex = eq
-                else:
-                    raise Exception(f'Cannot find operator for {op}')
-                v1, v2 = map(self.read, [r1, r2])
-                self.write(out, ex(v1, v2))
-
-            elif op == JUMP_IF_FALSE or op == JUMP_IF_TRUE:
-                v, jmp = params
-                value = self.read(v)
-                if op == JUMP_IF_FALSE:
-                    should_jump = value == 0
-                elif op == JUMP_IF_TRUE:
-                    should_jump = value != 0
-                
-                if should_jump:
-                    self.position = self.read(jmp)
-
-            elif op == INPUT:
-                self.write(params[0], self.input)
-
-            elif op == OUTPUT:
-                print('OUTPUT: ', self.read(params[0]))
-            
-            else:
-                raise Exception(f'Invalid ops code {op}, position {self.position}')
-
-            op, params = self.consume()
+def run_diagnostic(cache, memory, system_id):
+    for value in cache.run(memory, [system_id]):
+        print('OUTPUT: ', value)
 
 
 if __name__ == "__main__":
-    with open('../input/day_5.in') as f:
-        memory = list(map(int, f.readline().split(',')))
-
-    program_1 = Program(memory, 1)
-    program_1.execute()
-
-    program_2 = Program(memory, 5)
-    program_2.execute()
-
-
+    memory = load_input('../input/day_5.in').values()
+
+    # Diagnostics only depend on the program and system ID, so results from
+    # earlier runs are reused
+    cache = ResultCache('../output/intcode_cache.db')
+    run_diagnostic(cache, memory, 1)
+    run_diagnostic(cache, memory, 5)
+    cache.close()
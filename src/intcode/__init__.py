@@ -0,0 +1,26 @@
+from .opcodes import (
+    ADD, MULTIPLY, INPUT, OUTPUT, JUMP_IF_TRUE, JUMP_IF_FALSE, LESS_THAN,
+    EQUALS, MODE_SWITCH, EXIT, POSITION_MODE, IMMEDIATE_MODE, RELATIVE_MODE,
+    PARAM_COUNT, decode,
+)
+from .program import (
+    Program, Snapshot, HALTED, BLOCKED, OUTPUT_READY, PREEMPTED, parse_program,
+)
+from .memory import Memory
+from .analysis import Analysis
+from .compiler import CompiledProgram
+from .batch import BatchProgram
+from .sweep import sweep
+from .cache import ResultCache, image_hash
+from .async_program import AsyncProgram
+from .profiler import MemoryProfilingProgram, ProfilingProgram
+from .trace import TraceBuffer, TraceReader, TracingProgram
+from .image import ProgramImage, convert_input, load_input, write_image
+from .assembler import assemble
+from .scheduler import Scheduler
+from .dataflow import Channel, Graph
+from .ascii import AsciiProgram
+from .checkpoint import load_checkpoint, save_checkpoint
+from .network import ProcessNetwork
+from .memo import MemoizingProgram
+from .introspect import CellFinder, GridView, find_grid, silence_outputs
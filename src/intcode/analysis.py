@@ -0,0 +1,325 @@
+from collections import namedtuple
+
+from .memory import Memory
+from .opcodes import (
+    ADD, MULTIPLY, INPUT, OUTPUT, JUMP_IF_TRUE, JUMP_IF_FALSE, LESS_THAN,
+    EQUALS, MODE_SWITCH, EXIT, POSITION_MODE, IMMEDIATE_MODE, RELATIVE_MODE,
+    PARAM_COUNT, WRITE_PARAMS, decode,
+)
+
+MNEMONICS = {
+    ADD: 'add',
+    MULTIPLY: 'mul',
+    INPUT: 'in',
+    OUTPUT: 'out',
+    JUMP_IF_TRUE: 'jnz',
+    JUMP_IF_FALSE: 'jz',
+    LESS_THAN: 'lt',
+    EQUALS: 'eq',
+    MODE_SWITCH: 'arb',
+    EXIT: 'halt',
+}
+
+
+def format_param(mode, value):
+    if mode == IMMEDIATE_MODE:
+        return str(value)
+    if mode == POSITION_MODE:
+        return f'[{value}]'
+    return f'[rb{value:+d}]'
+
+
+def format_instruction(instruction):
+    op, *params, _ = instruction
+    args = [
+        format_param(params[2 * i], params[2 * i + 1])
+        for i in range(PARAM_COUNT[op])
+    ]
+    return ' '.join([MNEMONICS[op]] + args)
+
+
+# Linear sweep disassembly of memory, returning (address, text) lines.
+# Cells that do not decode as an instruction are shown as data.
+def disassemble(memory):
+    lines = []
+    address = 0
+    while address < len(memory):
+        try:
+            instruction = decode(memory, address)
+        except Exception:
+            lines.append((address, f'data {memory[address]}'))
+            address += 1
+            continue
+        lines.append((address, format_instruction(instruction)))
+        address = instruction[-1]
+    return lines
+
+
+Block = namedtuple('Block', ['start', 'end', 'instructions', 'successors'])
+Call = namedtuple('Call', ['address', 'target', 'return_address'])
+
+INFINITY = float('inf')
+
+# Relative base bounds that are still moving after this many updates at an
+# address are widened to infinity so that recursion terminates
+WIDEN_AFTER = 8
+
+
+# Static analysis of a program image: which addresses are reachable code,
+# its basic blocks and control-flow graph, calls and returns, and which
+# addresses the program may write to.
+#
+# Calls are recognised by the usual compiled Intcode idiom of writing an
+# immediate return address to a relative cell and then unconditionally
+# jumping to an immediate target:
+#
+#     add 1234 0 [rb+0]
+#     jnz 1 567
+#
+# and returns by an unconditional jump through a relative cell, which is
+# assumed to go back to one of the pushed return addresses. Any other jump
+# to a computed target, or reachable cells that do not decode, make the
+# analysis incomplete, and then every address may be modified.
+class Analysis:
+    def __init__(self, memory, entry=0):
+        self.memory = Memory(memory)
+        self.entry = entry
+        self.instructions = {}
+        self.successors = {}
+        self.calls = {}
+        self.returns = set()
+        self.indirect = set()
+        self.invalid = set()
+
+        self._explore()
+        self._find_blocks()
+        self._track_relative_base()
+        self._find_writes()
+
+
+    @property
+    def complete(self):
+        return not self.indirect and not self.invalid
+
+
+    def _jump_targets(self, address, instruction):
+        op, m1, v1, m2, v2, _, _, next_address = instruction
+        if m1 == IMMEDIATE_MODE:
+            taken = (v1 != 0) == (op == JUMP_IF_TRUE)
+            if not taken:
+                return (next_address,)
+        else:
+            taken = None
+
+        if m2 == IMMEDIATE_MODE:
+            return (v2,) if taken else (v2, next_address)
+        if taken and m2 == RELATIVE_MODE:
+            self.returns.add(address)
+            return ()
+        self.indirect.add(address)
+        return () if taken else (next_address,)
+
+
+    # Recursive descent from the entry point, following every jump with a
+    # known target and the return address of every recognised call
+    def _explore(self):
+        pending = [self.entry]
+        return_addresses = set()
+        while pending:
+            address = pending.pop()
+            if address in self.instructions or address in self.invalid:
+                continue
+            try:
+                instruction = decode(self.memory, address)
+            except Exception:
+                self.invalid.add(address)
+                continue
+            self.instructions[address] = instruction
+
+            op, m1, v1, m2, v2, m3, v3, next_address = instruction
+            if op == EXIT:
+                successors = ()
+            elif op == JUMP_IF_TRUE or op == JUMP_IF_FALSE:
+                successors = self._jump_targets(address, instruction)
+            else:
+                successors = (next_address,)
+                call = self._find_call(address, instruction)
+                if call is not None:
+                    self.calls[call.address] = call
+                    return_addresses.add(call.return_address)
+                    pending.append(call.return_address)
+
+            self.successors[address] = successors
+            pending.extend(successors)
+
+        # Returns may go back to any call site
+        for address in self.returns:
+            self.successors[address] = tuple(sorted(return_addresses))
+        if not return_addresses:
+            self.indirect |= self.returns
+
+
+    def _find_call(self, address, instruction):
+        op, m1, v1, m2, v2, m3, v3, next_address = instruction
+        if op not in (ADD, MULTIPLY) or m1 != IMMEDIATE_MODE or m2 != IMMEDIATE_MODE or m3 != RELATIVE_MODE:
+            return None
+        try:
+            jump = decode(self.memory, next_address)
+        except Exception:
+            return None
+        if jump[0] not in (JUMP_IF_TRUE, JUMP_IF_FALSE) or jump[1] != IMMEDIATE_MODE or jump[3] != IMMEDIATE_MODE:
+            return None
+        if (jump[2] != 0) != (jump[0] == JUMP_IF_TRUE):
+            return None
+        return Call(next_address, jump[4], v1 + v2 if op == ADD else v1 * v2)
+
+
+    # Blocks start at the entry, at jump targets and return addresses, and
+    # after every jump. They run until a jump, a halt, or the next block.
+    def _find_blocks(self):
+        leaders = {self.entry}
+        for address, successors in self.successors.items():
+            op = self.instructions[address][0]
+            if op in (JUMP_IF_TRUE, JUMP_IF_FALSE, EXIT):
+                leaders.update(successors)
+                leaders.add(self.instructions[address][-1])
+        for call in self.calls.values():
+            leaders.add(call.return_address)
+        leaders &= self.instructions.keys()
+
+        self.blocks = {}
+        for start in sorted(leaders):
+            addresses = []
+            address = start
+            while True:
+                addresses.append(address)
+                op, *_, next_address = self.instructions[address]
+                if op in (JUMP_IF_TRUE, JUMP_IF_FALSE, EXIT):
+                    break
+                if next_address in leaders or next_address not in self.instructions:
+                    break
+                address = next_address
+            self.blocks[start] = Block(
+                start, self.instructions[address][-1], tuple(addresses), self.successors[address]
+            )
+
+
+    # Interval analysis of the relative base, as (low, high) at each
+    # instruction before it runs
+    def _track_relative_base(self):
+        self.relative_bases = {self.entry: (0, 0)}
+        updates = {}
+        pending = [self.entry] if self.entry in self.instructions else []
+        while pending:
+            address = pending.pop()
+            low, high = self.relative_bases[address]
+            op, m1, v1, *_ = self.instructions[address]
+            if op == MODE_SWITCH:
+                if m1 == IMMEDIATE_MODE:
+                    low, high = low + v1, high + v1
+                else:
+                    low, high = -INFINITY, INFINITY
+
+            for successor in self.successors[address]:
+                if successor not in self.instructions:
+                    continue
+                old = self.relative_bases.get(successor)
+                if old is None:
+                    new = (low, high)
+                else:
+                    new = (min(old[0], low), max(old[1], high))
+                    if new == old:
+                        continue
+                    updates[successor] = updates.get(successor, 0) + 1
+                    if updates[successor] > WIDEN_AFTER:
+                        new = (
+                            -INFINITY if new[0] < old[0] else new[0],
+                            INFINITY if new[1] > old[1] else new[1],
+                        )
+                self.relative_bases[successor] = new
+                pending.append(successor)
+
+
+    def _find_writes(self):
+        self.code = set()
+        for address, instruction in self.instructions.items():
+            self.code.update(range(address, instruction[-1]))
+
+        # Constant addresses written in position mode, and (low, high)
+        # ranges written relative to the relative base
+        self.writes = set()
+        self.relative_writes = {}
+        for address, instruction in self.instructions.items():
+            param = WRITE_PARAMS.get(instruction[0])
+            if param is None:
+                continue
+            mode, value = instruction[1 + 2 * param], instruction[2 + 2 * param]
+            if mode == POSITION_MODE:
+                self.writes.add(value)
+            else:
+                low, high = self.relative_bases.get(address, (-INFINITY, INFINITY))
+                self.relative_writes[address] = (max(0, low + value), high + value)
+
+        if self.code:
+            self.code_start = min(self.code)
+            self.code_end = max(self.code)
+        else:
+            self.code_start = self.code_end = 0
+
+
+    def may_modify(self, address):
+        if not self.complete or address in self.writes:
+            return True
+        return any(low <= address <= high for low, high in self.relative_writes.values())
+
+
+    # Addresses that may be written and are also code, so that the program
+    # may modify itself there
+    def self_modified(self):
+        if not self.complete:
+            return set(self.code)
+        modified = self.code & self.writes
+        for low, high in self.relative_writes.values():
+            if low <= self.code_end and high >= self.code_start:
+                modified.update(cell for cell in self.code if low <= cell <= high)
+        return modified
+
+
+    # True if no reachable instruction can ever be overwritten, so the code
+    # can be decoded or compiled once without watching writes to it
+    def code_immutable(self):
+        return self.complete and not self.self_modified()
+
+
+    # Disassembly of the reachable code in address order with everything
+    # else shown as data, as (address, text) lines
+    def disassemble(self):
+        lines = []
+        address = 0
+        end = len(self.memory)
+        if self.instructions:
+            end = max(end, max(instruction[-1] for instruction in self.instructions.values()))
+        while address < end:
+            instruction = self.instructions.get(address)
+            if instruction is None:
+                lines.append((address, f'data {self.memory[address]}'))
+                address += 1
+                continue
+
+            text = format_instruction(instruction)
+            notes = []
+            if address in self.blocks:
+                notes.append('block')
+            if address in self.calls:
+                notes.append(f'call {self.calls[address].target}, returns to {self.calls[address].return_address}')
+            if address in self.returns:
+                notes.append('return')
+            if address in self.indirect:
+                notes.append('indirect jump')
+            if any(self.may_modify(cell) for cell in range(address, instruction[-1])):
+                notes.append('may be modified')
+            if notes:
+                text += '  ; ' + ', '.join(notes)
+            lines.append((address, text))
+            address = instruction[-1]
+        return lines
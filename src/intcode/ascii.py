@@ -0,0 +1,78 @@
+from .program import Program
+
+
+# Runs a program that talks in ASCII text. Outputs are collected into a
+# bytearray a whole run at a time rather than one character at a time, and
+# input is given as whole strings or byte buffers. Any output that is not
+# an ASCII character, such as the final answer of a text program, is put
+# aside in values instead of the text.
+class AsciiProgram:
+    def __init__(self, memory, engine=Program):
+        self.program = engine(memory)
+        self.text = bytearray()
+        self.values = []
+
+
+    @property
+    def halted(self):
+        return self.program.halted
+
+
+    # text is a str, which must be ASCII, or any bytes-like buffer
+    def send(self, text):
+        if isinstance(text, str):
+            text = text.encode('ascii')
+        self.program.feed(bytes(text))
+
+
+    def send_line(self, text):
+        self.send(text)
+        self.program.feed(b'\n')
+
+
+    # Runs until the program halts or needs input that it does not have
+    def run(self, text=None):
+        if text is not None:
+            self.send(text)
+        outputs = self.program.run_until_blocked()
+        try:
+            chunk = bytes(outputs)
+        except ValueError:
+            chunk = None
+        if chunk is not None and chunk.isascii():
+            self.text += chunk
+            return
+
+        for value in outputs:
+            if 0 <= value < 128:
+                self.text.append(value)
+            else:
+                self.values.append(value)
+
+
+    # Everything output so far, taken out of the buffer
+    def read(self):
+        text = bytes(self.text)
+        self.text.clear()
+        return text
+
+
+    # Complete lines output so far, without their newlines, leaving any
+    # partial line in the buffer
+    def lines(self):
+        return self._split(b'\n')
+
+
+    # Complete frames output so far, each ending with a blank line, as
+    # lists of lines
+    def frames(self):
+        return [frame.split('\n') for frame in self._split(b'\n\n')]
+
+
+    def _split(self, separator):
+        end = self.text.rfind(separator)
+        if end < 0:
+            return []
+        parts = self.text[:end].decode('ascii').split(separator.decode('ascii'))
+        del self.text[:end + len(separator)]
+        return parts
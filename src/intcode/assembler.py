@@ -0,0 +1,78 @@
+import re
+
+from .analysis import MNEMONICS
+from .opcodes import PARAM_COUNT, POSITION_MODE, IMMEDIATE_MODE, RELATIVE_MODE
+
+OPS = {mnemonic: op for op, mnemonic in MNEMONICS.items()}
+
+LABEL = re.compile(r'^([A-Za-z_]\w*):')
+RELATIVE = re.compile(r'^\[rb([+-].+)?\]$')
+
+
+# Assembles the syntax the disassembler prints, one instruction per line:
+#
+#     loop: add [i] 1 [i]      ; position, immediate and position params
+#           lt [i] 10 [rb+2]   ; relative to the relative base
+#           jnz [rb+2] loop    ; labels can be used anywhere a number can
+#           halt
+#     i:    data 0             ; raw cells
+#
+# Numbers can also be label+n or label-n. Everything after ; is a comment.
+def assemble(source):
+    lines = []
+    labels = {}
+    address = 0
+    for number, line in enumerate(source.splitlines(), 1):
+        line = line.split(';', 1)[0].strip()
+        while True:
+            match = LABEL.match(line)
+            if match is None:
+                break
+            if match.group(1) in labels:
+                raise Exception(f'Label {match.group(1)} defined twice, line {number}')
+            labels[match.group(1)] = address
+            line = line[match.end():].strip()
+        if not line:
+            continue
+
+        mnemonic, *params = line.split()
+        if mnemonic == 'data':
+            address += len(params)
+        elif mnemonic in OPS:
+            if len(params) != PARAM_COUNT[OPS[mnemonic]]:
+                raise Exception(f'{mnemonic} takes {PARAM_COUNT[OPS[mnemonic]]} params, line {number}')
+            address += 1 + len(params)
+        else:
+            raise Exception(f'Unknown instruction {mnemonic}, line {number}')
+        lines.append((number, mnemonic, params))
+
+    def value(text, number):
+        match = re.match(r'^([A-Za-z_]\w*)?([+-]?\d+)?$', text)
+        if match is None or not text:
+            raise Exception(f'Invalid value {text}, line {number}')
+        label, offset = match.groups()
+        if label is not None and label not in labels:
+            raise Exception(f'Unknown label {label}, line {number}')
+        return (labels[label] if label else 0) + int(offset or 0)
+
+    memory = []
+    for number, mnemonic, params in lines:
+        if mnemonic == 'data':
+            memory.extend(value(param, number) for param in params)
+            continue
+
+        op = OPS[mnemonic]
+        values = []
+        for i, param in enumerate(params):
+            match = RELATIVE.match(param)
+            if match is not None:
+                mode, param_value = RELATIVE_MODE, value((match.group(1) or '+0').lstrip('+'), number)
+            elif param.startswith('[') and param.endswith(']'):
+                mode, param_value = POSITION_MODE, value(param[1:-1], number)
+            else:
+                mode, param_value = IMMEDIATE_MODE, value(param, number)
+            op += mode * 10 ** (i + 2)
+            values.append(param_value)
+        memory.append(op)
+        memory.extend(values)
+    return memory
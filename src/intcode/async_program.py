@@ -0,0 +1,29 @@
+from .program import Program
+
+
+# Runs a program as a coroutine reading its input from one channel and
+# putting its outputs to another. Channels are asyncio.Queue or anything
+# else with the same get(), put(), get_nowait() and empty() methods.
+#
+# The program runs synchronously until it needs input that has not arrived
+# yet. Only then does it await the input channel, so a VM with input ready
+# never gives up the event loop between instructions.
+class AsyncProgram:
+    def __init__(self, memory, input, output, engine=Program):
+        self.program = engine(memory)
+        self.input = input
+        self.output = output
+
+
+    async def run(self):
+        while True:
+            for value in self.program.run_until_blocked():
+                await self.output.put(value)
+            if self.program.halted:
+                return
+
+            self.program.feed([await self.input.get()])
+
+            # Take everything else that is already waiting as well
+            while not self.input.empty():
+                self.program.feed([self.input.get_nowait()])
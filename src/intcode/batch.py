@@ -0,0 +1,183 @@
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .opcodes import (
+    ADD, MULTIPLY, INPUT, OUTPUT, JUMP_IF_TRUE, JUMP_IF_FALSE, LESS_THAN,
+    EQUALS, MODE_SWITCH, EXIT, IMMEDIATE_MODE, RELATIVE_MODE, PARAM_COUNT,
+    WRITE_PARAMS,
+)
+
+
+# Runs many copies of the same program side by side, one lane per copy. The
+# lanes' memories are the rows of a single matrix, and each step advances
+# every running lane by one instruction, grouping lanes by opcode so every
+# group executes as a handful of vectorised NumPy operations.
+#
+# Values are int64, so this is only for programs whose values fit in that.
+# Lanes that hit an invalid instruction, a negative address or run out of
+# input are stopped and marked as failed instead of raising.
+class BatchProgram:
+    def __init__(self, memory, lanes, inputs=None):
+        if np is None:
+            raise Exception('BatchProgram requires numpy')
+
+        self.memory = np.tile(np.array(memory, dtype=np.int64), (lanes, 1))
+        self.position = np.zeros(lanes, dtype=np.int64)
+        self.relative_base = np.zeros(lanes, dtype=np.int64)
+        self.halted = np.zeros(lanes, dtype=bool)
+        self.failed = np.zeros(lanes, dtype=bool)
+        self.outputs = [[] for _ in range(lanes)]
+
+        # Each lane's inputs are a row of the matrix, padded to the longest
+        inputs = [list(values) for values in inputs] if inputs is not None else [[]] * lanes
+        self.inputs = np.zeros((lanes, max(map(len, inputs), default=0)), dtype=np.int64)
+        for lane, values in enumerate(inputs):
+            self.inputs[lane, :len(values)] = values
+        self.input_count = np.array(list(map(len, inputs)), dtype=np.int64)
+        self.input_index = np.zeros(lanes, dtype=np.int64)
+
+
+    def _grow(self, size):
+        width = self.memory.shape[1]
+        if size > width:
+            padding = np.zeros((self.memory.shape[0], max(size, width * 2) - width), dtype=np.int64)
+            self.memory = np.concatenate([self.memory, padding], axis=1)
+
+
+    def _fail(self, lanes):
+        self.halted[lanes] = True
+        self.failed[lanes] = True
+
+
+    def _load(self, lanes, addresses):
+        # Called for immediate lanes too, whose values can be anything, so
+        # every index is clipped and only the lanes inside memory are kept
+        width = self.memory.shape[1]
+        inside = (addresses >= 0) & (addresses < width)
+        values = self.memory[lanes, np.clip(addresses, 0, width - 1)]
+        return np.where(inside, values, 0)
+
+
+    def step(self):
+        self._fail(np.flatnonzero(~self.halted & (self.position < 0)))
+        active = np.flatnonzero(~self.halted)
+        if not active.size:
+            return False
+
+        # Make sure every lane's instruction and params can be fetched
+        self._grow(int(self.position[active].max()) + 4)
+        raw = self.memory[active, self.position[active]]
+        ops = raw % 100
+        for op in np.unique(ops):
+            group = ops == op
+            self._execute(int(op), active[group], raw[group])
+        return True
+
+
+    def _execute(self, op, lanes, raw):
+        if op not in PARAM_COUNT:
+            self._fail(lanes)
+            return
+        if op == EXIT:
+            self.halted[lanes] = True
+            return
+
+        position = self.position[lanes]
+        count = PARAM_COUNT[op]
+        modes = [raw // 10 ** (i + 2) % 10 for i in range(count)]
+        values = [self.memory[lanes, position + 1 + i] for i in range(count)]
+        addresses = [
+            values[i] + np.where(modes[i] == RELATIVE_MODE, self.relative_base[lanes], 0)
+            for i in range(count)
+        ]
+
+        # A jump target is only read, and so checked, if the jump is taken
+        invalid = np.zeros(len(lanes), dtype=bool)
+        for i, (mode, address) in enumerate(zip(modes, addresses)):
+            invalid |= mode > RELATIVE_MODE
+            if not (op in (JUMP_IF_TRUE, JUMP_IF_FALSE) and i == 1):
+                invalid |= (mode != IMMEDIATE_MODE) & (address < 0)
+        if op in WRITE_PARAMS:
+            invalid |= modes[WRITE_PARAMS[op]] == IMMEDIATE_MODE
+        if op == INPUT:
+            invalid |= self.input_index[lanes] >= self.input_count[lanes]
+        if invalid.any():
+            self._fail(lanes[invalid])
+            keep = ~invalid
+            lanes, raw, position = lanes[keep], raw[keep], position[keep]
+            modes = [mode[keep] for mode in modes]
+            values = [value[keep] for value in values]
+            addresses = [address[keep] for address in addresses]
+            if not len(lanes):
+                return
+
+        def read(i):
+            return np.where(modes[i] == IMMEDIATE_MODE, values[i], self._load(lanes, addresses[i]))
+
+        def write(i, result):
+            self._grow(int(addresses[i].max()) + 1)
+            self.memory[lanes, addresses[i]] = result
+
+        if op == ADD:
+            write(2, read(0) + read(1))
+        elif op == MULTIPLY:
+            write(2, read(0) * read(1))
+        elif op == LESS_THAN or op == EQUALS:
+            if op == LESS_THAN:
+                result = (read(0) < read(1)).astype(np.int64)
+            else:
+                result = (read(0) == read(1)).astype(np.int64)
+            write(2, result)
+            self._fused_jump(lanes, position + 4, modes[2], values[2], result)
+            return
+        elif op == JUMP_IF_TRUE or op == JUMP_IF_FALSE:
+            condition = read(0) != 0
+            if op == JUMP_IF_FALSE:
+                condition = ~condition
+            invalid = condition & (modes[1] != IMMEDIATE_MODE) & (addresses[1] < 0)
+            self._fail(lanes[invalid])
+            target = read(1)
+            self.position[lanes[~invalid]] = np.where(condition, target, position + 3)[~invalid]
+            return
+        elif op == MODE_SWITCH:
+            self.relative_base[lanes] += read(0)
+        elif op == INPUT:
+            index = self.input_index[lanes]
+            write(0, self.inputs[lanes, index])
+            self.input_index[lanes] = index + 1
+        elif op == OUTPUT:
+            for lane, value in zip(lanes.tolist(), read(0).tolist()):
+                self.outputs[lane].append(value)
+
+        self.position[lanes] = position + 1 + count
+
+
+    # Runs the jump after a compare in the same step when it jumps on the
+    # result just written, or unconditionally, to an immediate target. The
+    # jump is read after the write, so lanes that overwrote it still see it
+    # as it now is. Other lanes stop at position.
+    def _fused_jump(self, lanes, position, mode, value, result):
+        self._grow(int(position.max()) + 3)
+        raw = self.memory[lanes, position]
+        op = raw % 100
+        condition_mode = raw // 100 % 10
+        condition = self.memory[lanes, position + 1]
+        target = self.memory[lanes, position + 2]
+
+        fused = (op == JUMP_IF_TRUE) | (op == JUMP_IF_FALSE)
+        fused &= raw // 1000 % 10 == IMMEDIATE_MODE
+        fused &= (condition_mode == IMMEDIATE_MODE) | ((condition_mode == mode) & (condition == value))
+        taken = np.where(condition_mode == IMMEDIATE_MODE, condition, result) != 0
+        taken ^= op == JUMP_IF_FALSE
+        self.position[lanes] = np.where(fused, np.where(taken, target, position + 3), position)
+
+
+    def run(self, max_steps=None):
+        steps = 0
+        while self.step():
+            steps += 1
+            if max_steps is not None and steps >= max_steps:
+                break
+        return self.outputs
@@ -0,0 +1,114 @@
+from collections import OrderedDict
+from hashlib import sha256
+import sqlite3
+import time
+
+from .program import Program
+
+
+def image_hash(memory):
+    return sha256(','.join(map(str, memory)).encode()).hexdigest()
+
+
+def result_key(digest, inputs):
+    return digest + ':' + ','.join(map(str, inputs))
+
+
+# Caches the outputs of running a program to completion on a fixed list of
+# inputs, keyed by a hash of the program image and the inputs. Results are
+# kept in an in-memory LRU, and also in an sqlite file if path is given, so
+# that separate runs of a script can share them. Both tiers evict their
+# least recently used entries once they go over their size limits.
+class ResultCache:
+    def __init__(self, path=None, max_entries=4096, max_disk_bytes=64 * 1024 * 1024):
+        self.entries = OrderedDict()
+        self.max_entries = max_entries
+        self.max_disk_bytes = max_disk_bytes
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self.db = None
+        if path is not None:
+            self.db = sqlite3.connect(path)
+            self.db.execute('''
+                CREATE TABLE IF NOT EXISTS results (
+                    key TEXT PRIMARY KEY,
+                    outputs TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    used REAL NOT NULL
+                )
+            ''')
+            self.db.execute('CREATE INDEX IF NOT EXISTS results_used ON results (used)')
+
+
+    def get(self, key):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+
+        if self.db is not None:
+            row = self.db.execute('SELECT outputs FROM results WHERE key = ?', (key,)).fetchone()
+            if row is not None:
+                self.db.execute('UPDATE results SET used = ? WHERE key = ?', (time.time(), key))
+                self.db.commit()
+                outputs = [int(value) for value in row[0].split(',') if value]
+                self._remember(key, outputs)
+                self.disk_hits += 1
+                return outputs
+
+        self.misses += 1
+        return None
+
+
+    def put(self, key, outputs):
+        self._remember(key, outputs)
+        if self.db is not None:
+            text = ','.join(map(str, outputs))
+            self.db.execute(
+                'INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)',
+                (key, text, len(key) + len(text), time.time()),
+            )
+            self._evict_disk()
+            self.db.commit()
+
+
+    def _remember(self, key, outputs):
+        self.entries[key] = outputs
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+
+    def _evict_disk(self):
+        total, = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM results').fetchone()
+        if total <= self.max_disk_bytes:
+            return
+
+        excess = total - self.max_disk_bytes
+        for key, size in self.db.execute('SELECT key, size FROM results ORDER BY used').fetchall():
+            self.db.execute('DELETE FROM results WHERE key = ?', (key,))
+            excess -= size
+            if excess <= 0:
+                break
+
+
+    # Returns the outputs of running memory on inputs, only running the
+    # program if the result is not cached. Pass digest to skip hashing the
+    # image when running the same image many times.
+    def run(self, memory, inputs, digest=None, engine=Program):
+        inputs = tuple(inputs)
+        key = result_key(digest or image_hash(memory), inputs)
+        outputs = self.get(key)
+        if outputs is None:
+            outputs = list(engine(memory, iter(inputs)).execute())
+            self.put(key, outputs)
+        return outputs
+
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
@@ -0,0 +1,106 @@
+from array import array
+from collections import deque
+import io
+import os
+import pickle
+import zlib
+
+from .memory import Memory
+from .program import Program
+
+MAGIC = b'ICSTATE1'
+
+
+def engines(cls=Program):
+    found = {cls.__name__: cls}
+    for subclass in cls.__subclasses__():
+        found.update(engines(subclass))
+    return found
+
+
+# Programs are saved as their state rather than pickled as objects: memory
+# cells and pages, position, relative base and the inputs fed but not yet
+# read. Decoded instructions and compiled blocks are rebuilt as they run,
+# and an input iterator cannot be saved, so it has to be given again.
+#
+# A program is saved in full the first time it is reached and by its index
+# after that, so a program the state refers to more than once is loaded as
+# one program again.
+class Pickler(pickle.Pickler):
+    def __init__(self, file, protocol=None):
+        super().__init__(file, protocol)
+        self.saved = {}
+
+
+    def persistent_id(self, obj):
+        if not isinstance(obj, Program):
+            return None
+        if id(obj) in self.saved:
+            return ('saved', self.saved[id(obj)])
+        self.saved[id(obj)] = len(self.saved)
+
+        memory = obj.memory
+        cells = array('q', memory.cells) if isinstance(memory.cells, memoryview) else memory.cells
+        return (
+            'program', type(obj).__name__, cells, memory.pages, memory.sparse_start,
+            obj.position, obj.relative_base, obj.halted, list(obj.inputs),
+        )
+
+
+class Unpickler(pickle.Unpickler):
+    def __init__(self, file, input):
+        super().__init__(file)
+        self.engines = engines()
+        self.input = input
+        self.loaded = []
+
+
+    def persistent_load(self, pid):
+        if pid[0] == 'saved':
+            return self.loaded[pid[1]]
+        _, name, cells, pages, sparse_start, position, relative_base, halted, inputs = pid
+        if name not in self.engines:
+            raise Exception(f'Unknown engine {name} in checkpoint')
+
+        memory = Memory()
+        memory.cells = cells
+        memory.pages = pages
+        memory.sparse_start = sparse_start
+        # Programs forked from each other share cells and pages, and are
+        # loaded sharing them again, so every program copies before writing
+        memory.owns_cells = False
+
+        program = self.engines[name]([], self.input)
+        program.memory = memory
+        program.position = position
+        program.relative_base = relative_base
+        program.halted = halted
+        program.inputs = deque(inputs)
+        self.loaded.append(program)
+        return program
+
+
+# Saves state, which is anything picklable holding any number of programs
+# alongside the host's own state, such as a screen dict. The file is
+# compressed, and written next to path and renamed into place so that a
+# process killed while saving leaves the previous checkpoint intact.
+def save_checkpoint(path, state):
+    buffer = io.BytesIO()
+    Pickler(buffer, pickle.HIGHEST_PROTOCOL).dump(state)
+
+    temporary = f'{path}.{os.getpid()}.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(MAGIC)
+        f.write(zlib.compress(buffer.getvalue()))
+    os.replace(temporary, path)
+
+
+# Loads a checkpoint written by save_checkpoint, giving every program in it
+# input as its input iterator. Checkpoints are pickles, so only load ones
+# you wrote yourself.
+def load_checkpoint(path, input=None):
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise Exception(f'Not an Intcode checkpoint: {path}')
+        data = zlib.decompress(f.read())
+    return Unpickler(io.BytesIO(data), input).load()
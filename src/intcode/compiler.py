@@ -0,0 +1,446 @@
+from functools import lru_cache
+import sys
+
+from .opcodes import (
+    ADD, MULTIPLY, INPUT, OUTPUT, JUMP_IF_TRUE, JUMP_IF_FALSE, LESS_THAN,
+    EQUALS, MODE_SWITCH, POSITION_MODE, IMMEDIATE_MODE, RELATIVE_MODE, decode,
+)
+from .loops import counted_loop, fast_forward
+from .program import Program, HALTED, BLOCKED, OUTPUT_READY, PREEMPTED
+
+# Status returned by a compiled block, along with the next position (the
+# input instruction itself for BLOCK_INPUT), the relative base, a value
+# whose meaning depends on the status and the budget left
+CONTINUE = 0
+WRITTEN = 1
+BLOCK_OUTPUT = 2
+BLOCK_INPUT = 3
+BLOCK_EXIT = 4
+UNGUARDED = 5
+INTERPRET = 6
+
+# Blocks thrown away this many times by writes to their own code are run
+# by interpret() from then on rather than compiled yet again
+MAX_RECOMPILES = 4
+
+OPERATORS = {
+    ADD: '{} + {}',
+    MULTIPLY: '{} * {}',
+    LESS_THAN: '1 if {} < {} else 0',
+    EQUALS: '1 if {} == {} else 0',
+}
+
+
+@lru_cache(maxsize=4096)
+def compile_block(source):
+    namespace = {'fast_forward': fast_forward}
+    exec(compile(source, '<intcode block>', 'exec'), namespace)
+    return namespace['block']
+
+
+# Runs the single instruction at position as a compiled block would, for
+# code that is rewritten too often to be worth compiling
+def interpret(memory, code_cells, position, rb, budget):
+    op, m1, v1, m2, v2, m3, v3, next_position = decode(memory, position)
+    budget -= 1
+    if op == INPUT:
+        return BLOCK_INPUT, position, rb, rb + v1 if m1 == RELATIVE_MODE else v1, budget
+    if op not in OPERATORS and op not in (OUTPUT, MODE_SWITCH, JUMP_IF_TRUE, JUMP_IF_FALSE):
+        return BLOCK_EXIT, position, rb, None, budget
+
+    a = v1 if m1 == IMMEDIATE_MODE else memory[rb + v1 if m1 == RELATIVE_MODE else v1]
+    if op == OUTPUT:
+        return BLOCK_OUTPUT, next_position, rb, a, budget
+    if op == MODE_SWITCH:
+        return CONTINUE, next_position, rb + a, None, budget
+
+    if op == JUMP_IF_TRUE or op == JUMP_IF_FALSE:
+        if (a != 0) != (op == JUMP_IF_TRUE):
+            return CONTINUE, next_position, rb, None, budget
+
+    b = v2 if m2 == IMMEDIATE_MODE else memory[rb + v2 if m2 == RELATIVE_MODE else v2]
+    if op == JUMP_IF_TRUE or op == JUMP_IF_FALSE:
+        return CONTINUE, b, rb, None, budget
+
+    if op == ADD:
+        result = a + b
+    elif op == MULTIPLY:
+        result = a * b
+    elif op == LESS_THAN:
+        result = 1 if a < b else 0
+    else:
+        result = 1 if a == b else 0
+    address = rb + v3 if m3 == RELATIVE_MODE else v3
+    memory[address] = result
+    if address in code_cells:
+        return WRITTEN, next_position, rb, address, budget
+    return CONTINUE, next_position, rb, None, budget
+
+
+# Generates the source of a function running the basic block at start. The
+# function takes (memory, cells, code_cells, rb, budget) and returns a tuple
+# of (status, position, rb, value, budget). Blocks end at jumps and I/O, and
+# a block that conditionally jumps back to its own start is compiled into a
+# loop. Every pass through the block is charged its instruction count, and
+# a loop returns to the engine once the budget is used up.
+#
+# Relative base changes by an immediate amount are tracked statically as
+# delta so that relative params become constant offsets from rb. A pass
+# that would reach a negative address through any of them returns
+# INTERPRET without running anything, and the engine interprets its first
+# instruction instead. Earlier instructions can rewrite later ones, so
+# only the interpreter can tell whether the access really happens.
+#
+# Given an Analysis proving the code immutable, writes are not checked
+# against code_cells. Relative writes are instead guarded once per pass by
+# checking that rb keeps them clear of the code, and the block returns
+# UNGUARDED without running anything if it does not.
+class BlockCompiler:
+    def __init__(self, memory, start, analysis=None):
+        self.memory = memory
+        self.start = start
+        self.analysis = analysis
+        self.lines = []
+        self.delta = 0
+        self.temps = 0
+        self.offsets = []
+        self.write_offsets = []
+        self.last_write = None
+        self.body = []
+        self.preamble = []
+        self.size = 0
+        self.dense_size = len(memory.cells)
+
+
+    def emit(self, line):
+        self.lines.append('        ' + line)
+
+
+    def temp(self):
+        self.temps += 1
+        return f't{self.temps}'
+
+
+    def base(self, offset):
+        offset += self.delta
+        self.offsets.append(offset)
+        return f'rb + {offset}' if offset else 'rb'
+
+
+    def read(self, mode, value):
+        if mode == IMMEDIATE_MODE:
+            return repr(value)
+
+        # A compare or add followed by a jump on its result reuses the
+        # result rather than loading it back from the cell just written
+        key = (mode, value + self.delta if mode == RELATIVE_MODE else value)
+        if self.last_write is not None and self.last_write[0] == key:
+            return self.last_write[1]
+
+        name = self.temp()
+        if mode == POSITION_MODE:
+            # The dense cells never shrink, so addresses inside them now
+            # are always inside them
+            if value < self.dense_size:
+                self.emit(f'{name} = cells[{value}]')
+            else:
+                self.emit(f'{name} = memory[{value}]')
+        else:
+            address = self.base(value)
+            self.emit('try:')
+            self.emit(f'    {name} = cells[{address}]')
+            self.emit('except IndexError:')
+            self.emit(f'    {name} = memory[{address}]')
+        return name
+
+
+    # Jump targets are only read if the jump is taken, so their reads are
+    # left out of the negative address check on entry. Memory raises for
+    # negative addresses where cells would wrap around.
+    def jump_target(self, mode, value):
+        key = (mode, value + self.delta if mode == RELATIVE_MODE else value)
+        if self.last_write is not None and self.last_write[0] == key:
+            return self.last_write[1]
+        if mode == POSITION_MODE:
+            return f'cells[{value}]' if 0 <= value < self.dense_size else f'memory[{value}]'
+        offset = value + self.delta
+        address = f'rb + {offset}' if offset else 'rb'
+        return f'(cells[{address}] if 0 <= {address} < len(cells) else memory[{address}])'
+
+
+    def write(self, mode, value, result, next_address):
+        self.last_write = ((mode, value + self.delta if mode == RELATIVE_MODE else value), result)
+        address = self.base(value) if mode == RELATIVE_MODE else repr(value)
+        if mode == RELATIVE_MODE:
+            self.emit(f'a = {address}')
+            address = 'a'
+        self.emit('try:')
+        self.emit(f'    cells[{address}] = {result}')
+        self.emit('except (IndexError, OverflowError):')
+        self.emit(f'    memory[{address}] = {result}')
+        self.emit('    cells = memory.cells')
+        if self.analysis is not None:
+            if mode == RELATIVE_MODE:
+                self.write_offsets.append(self.delta + value)
+            return
+        self.emit(f'if {address} in code_cells:')
+        self.emit(f'    return {WRITTEN}, {next_address}, {self.rb()}, {address}, budget')
+
+
+    def rb(self):
+        return f'rb + {self.delta}' if self.delta else 'rb'
+
+
+    def compile(self):
+        address = self.start
+        while True:
+            try:
+                op, m1, v1, m2, v2, m3, v3, next_address = decode(self.memory, address)
+            except Exception:
+                # Leave invalid instructions for the interpreter to report
+                # if they are ever reached
+                if address == self.start:
+                    raise
+                self.emit(f'return {CONTINUE}, {address}, {self.rb()}, None, budget')
+                break
+            self.size += 1
+
+            if op in OPERATORS:
+                left = self.read(m1, v1)
+                right = self.read(m2, v2)
+                result = self.temp()
+                self.emit(f'{result} = ' + OPERATORS[op].format(left, right))
+                self.write(m3, v3, result, next_address)
+                if self.body is not None:
+                    self.body.append((op, m1, v1, m2, v2, m3, v3, next_address))
+
+            elif op == MODE_SWITCH:
+                self.body = None
+                if m1 == IMMEDIATE_MODE:
+                    self.delta += v1
+                else:
+                    # Relative params after this are no longer known offsets
+                    # from the rb the block was entered with
+                    self.emit(f'return {CONTINUE}, {next_address}, {self.rb()} + {self.read(m1, v1)}, None, budget')
+                    address = next_address
+                    break
+
+            elif op == JUMP_IF_TRUE or op == JUMP_IF_FALSE:
+                condition = self.read(m1, v1)
+                test = '!= 0' if op == JUMP_IF_TRUE else '== 0'
+
+                if m2 == IMMEDIATE_MODE and v2 == self.start:
+                    # Counted loops are skipped to their end in one go
+                    # whenever fast_forward can prove that is safe
+                    loop = counted_loop(self.body, (op, m1, v1)) if self.body is not None else None
+                    if loop is not None:
+                        self.preamble = [
+                            f'    if fast_forward(memory, code_cells, rb, {loop!r}):',
+                            f'        return {CONTINUE}, {next_address}, rb, None, budget',
+                        ]
+                    self.emit(f'if {condition} {test}:')
+                    if self.delta:
+                        self.emit(f'    rb += {self.delta}')
+                    self.emit('    if budget > 0:')
+                    self.emit('        continue')
+                    self.emit(f'    return {CONTINUE}, {self.start}, rb, None, budget')
+                    self.emit(f'return {CONTINUE}, {next_address}, {self.rb()}, None, budget')
+                elif m2 == IMMEDIATE_MODE:
+                    self.emit(f'return {CONTINUE}, ({v2} if {condition} {test} else {next_address}), {self.rb()}, None, budget')
+                else:
+                    self.emit(f'if {condition} {test}:')
+                    self.emit(f'    return {CONTINUE}, {self.jump_target(m2, v2)}, {self.rb()}, None, budget')
+                    self.emit(f'return {CONTINUE}, {next_address}, {self.rb()}, None, budget')
+                address = next_address
+                break
+
+            elif op == OUTPUT:
+                self.emit(f'return {BLOCK_OUTPUT}, {next_address}, {self.rb()}, {self.read(m1, v1)}, budget')
+                address = next_address
+                break
+
+            elif op == INPUT:
+                target = self.base(v1) if m1 == RELATIVE_MODE else repr(v1)
+                self.emit(f'return {BLOCK_INPUT}, {address}, {self.rb()}, {target}, budget')
+                address = next_address
+                break
+
+            else:
+                self.emit(f'return {BLOCK_EXIT}, {address}, {self.rb()}, None, budget')
+                address = next_address
+                break
+
+            address = next_address
+
+        # Every path through the body returns or loops back to the start
+        header = ['def block(memory, cells, code_cells, rb, budget):'] + self.preamble + ['    while True:']
+        if self.offsets:
+            header.append(f'        if rb + {min(self.offsets)} < 0:')
+            header.append(f'            return {INTERPRET}, {self.start}, rb, None, budget')
+        if self.write_offsets:
+            header.append(
+                f'        if rb + {min(self.write_offsets)} <= {self.analysis.code_end}'
+                f' and rb + {max(self.write_offsets)} >= {self.analysis.code_start}:'
+            )
+            header.append(f'            return {UNGUARDED}, {self.start}, rb, None, budget')
+        header.append(f'        budget -= {self.size}')
+        return '\n'.join(header + self.lines) + '\n', address
+
+
+# Runs the program as compiled basic blocks instead of decoding one
+# instruction at a time. Writes to cells any compiled block was generated
+# from throw that block away so that it is recompiled from the new code,
+# until it has been thrown away MAX_RECOMPILES times, after which its cells
+# are interpreted.
+#
+# An Analysis of the image lets blocks skip those write checks if it proves
+# the code immutable. Reaching code the analysis did not find falls back
+# to checking every write.
+class CompiledProgram(Program):
+    def __init__(self, memory, input=None, analysis=None):
+        super().__init__(memory, input)
+        self.blocks = {}
+        self.block_cells = {}
+        self.analysis = analysis if analysis is not None and analysis.code_immutable() else None
+        self.guarded = set()
+        # Times each block start was thrown away by a write, and the cells
+        # of blocks that reached MAX_RECOMPILES
+        self.recompiles = {}
+        self.interpreted = set()
+
+
+    def _own_decoded(self):
+        super()._own_decoded()
+        self.blocks = dict(self.blocks)
+        self.block_cells = dict(self.block_cells)
+        self.recompiles = dict(self.recompiles)
+        self.interpreted = set(self.interpreted)
+
+
+    def _compile(self, start):
+        if not self.owns_decoded:
+            self._own_decoded()
+        analysis = self.analysis
+        if analysis is not None and start not in analysis.instructions:
+            self.analysis = analysis = None
+            self.blocks = {}
+            self.block_cells = {}
+        if start in self.guarded:
+            analysis = None
+        source, end = BlockCompiler(self.memory, start, analysis).compile()
+        block = compile_block(source)
+        self.blocks[start] = (block, end)
+        for cell in range(start, end):
+            self.block_cells[cell] = self.block_cells.get(cell, ()) + (start,)
+        return block
+
+
+    # Writes from the host also throw away blocks compiled from the cell
+    def store(self, address, result):
+        super().store(address, result)
+        if address in self.block_cells:
+            self._invalidate_blocks(address)
+
+
+    def _invalidate_blocks(self, address):
+        if not self.owns_decoded:
+            self._own_decoded()
+        for start in self.block_cells.get(address, ()):
+            count = self.recompiles.get(start, 0) + 1
+            self.recompiles[start] = count
+            if count >= MAX_RECOMPILES:
+                self.interpreted.update(range(start, self.blocks[start][1]))
+            self._drop_block(start)
+
+
+    def _drop_block(self, start):
+        _, end = self.blocks.pop(start)
+        for cell in range(start, end):
+            remaining = tuple(s for s in self.block_cells[cell] if s != start)
+            if remaining:
+                self.block_cells[cell] = remaining
+            else:
+                del self.block_cells[cell]
+
+
+    # Budgets are charged a whole pass of a block at a time, so a budgeted
+    # run can overshoot by up to one block, and a counted loop skipped to its
+    # end is not charged for the passes it skips.
+    def _run(self, outputs, stop_on_output, budget=-1):
+        memory = self.memory
+        inputs = self.inputs
+        position = self.position
+        relative_base = self.relative_base
+        if budget < 0:
+            budget = sys.maxsize
+
+        interpret_next = False
+        while True:
+            if budget <= 0:
+                status = PREEMPTED
+                break
+            entry = self.blocks.get(position)
+            if interpret_next or (entry is None and position in self.interpreted):
+                interpret_next = False
+                status, position, relative_base, value, budget = interpret(
+                    memory, self.block_cells, position, relative_base, budget
+                )
+            else:
+                block = self._compile(position) if entry is None else entry[0]
+                if not memory.owns_cells:
+                    memory._own_cells()
+                status, position, relative_base, value, budget = block(
+                    memory, memory.cells, self.block_cells, relative_base, budget
+                )
+            if status == CONTINUE:
+                continue
+
+            if status == WRITTEN:
+                self._invalidate_blocks(value)
+
+            elif status == INTERPRET:
+                interpret_next = True
+
+            elif status == UNGUARDED:
+                # The relative base left the range the analysis allowed for,
+                # so this block checks its writes from now on
+                if not self.owns_decoded:
+                    self._own_decoded()
+                self.guarded.add(position)
+                self._drop_block(position)
+
+            elif status == BLOCK_OUTPUT:
+                outputs.append(value)
+                if stop_on_output:
+                    status = OUTPUT_READY
+                    break
+
+            elif status == BLOCK_INPUT:
+                # Blocks stop at the input instruction itself, so running
+                # out of input, or an input that raises, leaves the program
+                # able to resume from it
+                if inputs:
+                    result = inputs.popleft()
+                elif self.input is not None:
+                    self.position = position
+                    self.relative_base = relative_base
+                    result = next(self.input)
+                else:
+                    budget += 1
+                    status = BLOCKED
+                    break
+
+                position += 2
+                memory[value] = result
+                if value in self.block_cells:
+                    self._invalidate_blocks(value)
+
+            else:
+                self.halted = True
+                status = HALTED
+                break
+
+        self.position = position
+        self.relative_base = relative_base
+        self.budget_left = max(budget, 0)
+        return status
@@ -0,0 +1,186 @@
+from collections import deque
+
+from .program import BLOCKED, OUTPUT_READY
+
+
+# A bounded FIFO of values from one node to another, kept in a ring buffer
+# allocated once when the channel is made
+class Channel:
+    def __init__(self, source, target, capacity):
+        self.source = source
+        self.target = target
+        self.capacity = capacity
+        self.buffer = [0] * capacity
+        self.start = 0
+        self.size = 0
+
+
+    def __len__(self):
+        return self.size
+
+
+    def room(self):
+        return self.capacity - self.size
+
+
+    def put(self, value):
+        if self.size == self.capacity:
+            raise Exception(f'Channel from {self.source.name} to {self.target.name} is full')
+        self.buffer[(self.start + self.size) % self.capacity] = value
+        self.size += 1
+
+
+    # The values waiting in the channel, oldest first, without taking them
+    def values(self):
+        end = self.start + self.size
+        if end <= self.capacity:
+            return self.buffer[self.start:end]
+        return self.buffer[self.start:] + self.buffer[:end - self.capacity]
+
+
+    def get(self):
+        if not self.size:
+            raise Exception(f'Channel from {self.source.name} to {self.target.name} is empty')
+        value = self.buffer[self.start]
+        self.start = (self.start + 1) % self.capacity
+        self.size -= 1
+        return value
+
+
+    def take(self):
+        values = self.values()
+        self.start = (self.start + self.size) % self.capacity
+        self.size = 0
+        return values
+
+
+    # Doubles the capacity, keeping the values waiting in order
+    def grow(self):
+        values = self.values()
+        self.capacity *= 2
+        self.buffer = values + [0] * (self.capacity - len(values))
+        self.start = 0
+
+
+class Node:
+    def __init__(self, name, program):
+        self.name = name
+        self.program = program
+        self.in_channels = []
+        self.out_channels = []
+        # Outputs of a node with nothing connected to its output
+        self.outputs = []
+
+
+    # Runs the program for as long as every output channel has room, giving
+    # it one value from the input channels each time it asks for input so
+    # that values wait in the bounded channels rather than in the program.
+    # Returns the nodes that may now be able to run as well.
+    def run(self):
+        program = self.program
+        if program.halted:
+            # Anything still arriving is left in the channels to be read
+            return ()
+
+        woken = []
+        sent = False
+        outputs = [] if self.out_channels else self.outputs
+        room = min(channel.room() for channel in self.out_channels) if self.out_channels else None
+        while room != 0:
+            status = program._run(outputs, bool(self.out_channels))
+            if status == OUTPUT_READY:
+                for channel in self.out_channels:
+                    channel.put(outputs[0])
+                outputs.clear()
+                room -= 1
+                sent = True
+            elif status == BLOCKED:
+                channel = self.next_input()
+                if channel is None:
+                    break
+                program.feed((channel.get(),))
+                woken.append(channel.source)
+            else:
+                break
+        if sent:
+            woken += [channel.target for channel in self.out_channels]
+        return woken
+
+
+    # The first input channel, in the order they were connected, with a
+    # value waiting
+    def next_input(self):
+        for channel in self.in_channels:
+            if channel.size:
+                return channel
+        return None
+
+
+# A network of programs with the outputs of each node sent along bounded
+# channels to the inputs of others. Cycles are allowed, an output connected
+# to several nodes goes to every one of them, and a node with several
+# inputs reads from the first of them, in the order they were connected,
+# that has a value waiting.
+#
+# run() drives the nodes in the order data becomes ready for them: a node
+# runs when values arrive for it or when room is made on a full output
+# channel, and stops when it needs input, halts or fills an output channel.
+# Nodes in a cycle can end up each waiting for room in a full channel to
+# the next. The smallest full channel is then doubled, as few times as it
+# takes, so channels only grow beyond their capacity to avoid deadlock.
+# It returns once no node can make progress otherwise.
+class Graph:
+    def __init__(self, capacity=64):
+        self.capacity = capacity
+        self.nodes = {}
+
+
+    def add(self, program, name=None, inputs=()):
+        if name is None:
+            name = len(self.nodes)
+        if name in self.nodes:
+            raise Exception(f'Node {name} already added')
+        self.nodes[name] = Node(name, program)
+        program.feed(inputs)
+        return name
+
+
+    def connect(self, source, target, capacity=None):
+        source, target = self.nodes[source], self.nodes[target]
+        channel = Channel(source, target, capacity or self.capacity)
+        source.out_channels.append(channel)
+        target.in_channels.append(channel)
+        return channel
+
+
+    def run(self):
+        ready = deque(self.nodes.values())
+        queued = set(self.nodes)
+        while True:
+            while ready:
+                node = ready.popleft()
+                queued.discard(node.name)
+                for other in node.run():
+                    if other.name not in queued:
+                        queued.add(other.name)
+                        ready.append(other)
+
+            # A full channel between two nodes that have not halted means
+            # the reader is itself waiting on a full channel
+            full = [
+                channel for node in self.nodes.values() if not node.program.halted
+                for channel in node.out_channels
+                if not channel.room() and not channel.target.program.halted
+            ]
+            if not full:
+                return
+            channel = min(full, key=lambda channel: channel.capacity)
+            channel.grow()
+            queued.add(channel.source.name)
+            ready.append(channel.source)
+
+
+    # Nodes that have not halted, which after run() are waiting on input or
+    # on room in a full channel
+    def waiting(self):
+        return [name for name, node in self.nodes.items() if not node.program.halted]
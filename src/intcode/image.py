@@ -0,0 +1,147 @@
+from array import array
+import mmap
+import os
+import struct
+
+from .analysis import Analysis
+from .cache import image_hash
+from .memory import Memory
+from .program import parse_program
+
+# A program image file is a fixed header followed by the cells as int64,
+# the optional decode table and the bigint side table:
+#
+#     header    magic, cell count, decoded count, bigint count, sha256
+#     cells     one int64 per cell, 0 where the value is a bigint
+#     decoded   9 int64 per instruction: address and the decoded tuple
+#     bigints   per value: int64 index, int64 byte length, signed bytes
+#
+# The cells come first after the header so that they can be used in place
+# from a read-only mmap, shared between every process that loads the file.
+MAGIC = b'ICIMAGE1'
+HEADER = struct.Struct('<8sqqq32s')
+BIGINT = struct.Struct('<qq')
+DECODED = 9
+
+INT64_MIN = -(1 << 63)
+INT64_MAX = (1 << 63) - 1
+
+
+def fits(value):
+    return INT64_MIN <= value <= INT64_MAX
+
+
+def write_image(path, memory, decode=True):
+    values = list(memory)
+    cells = array('q', (value if fits(value) else 0 for value in values))
+    bigints = [(index, value) for index, value in enumerate(values) if not fits(value)]
+
+    # Decodings of the reachable code, found by static analysis
+    decoded = array('q')
+    if decode:
+        for address, instruction in sorted(Analysis(values).instructions.items()):
+            if all(map(fits, instruction)):
+                decoded.append(address)
+                decoded.extend(instruction)
+
+    # Written next to the destination and renamed into place, so a process
+    # loading the image never sees it half written
+    temporary = f'{path}.{os.getpid()}.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(HEADER.pack(
+            MAGIC, len(cells), len(decoded) // DECODED, len(bigints), bytes.fromhex(image_hash(values))
+        ))
+        f.write(cells.tobytes())
+        f.write(decoded.tobytes())
+        for index, value in bigints:
+            data = value.to_bytes(value.bit_length() // 8 + 1, 'little', signed=True)
+            f.write(BIGINT.pack(index, len(data)))
+            f.write(data)
+    os.replace(temporary, path)
+
+
+# A program image mapped read-only from disk. It reads like the list of
+# values it was written from, and memory() gives a Memory using the mapped
+# cells directly until the program first writes to them.
+class ProgramImage:
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, cell_count, decoded_count, bigint_count, digest = HEADER.unpack_from(self.mmap)
+        if magic != MAGIC:
+            raise Exception(f'Not an Intcode image: {path}')
+        self.digest = digest.hex()
+
+        offset = HEADER.size
+        self.cells = memoryview(self.mmap)[offset:offset + 8 * cell_count].cast('q')
+        offset += 8 * cell_count
+
+        table = memoryview(self.mmap)[offset:offset + 8 * DECODED * decoded_count].cast('q')
+        self.decoded = {}
+        for i in range(0, len(table), DECODED):
+            self.decoded[table[i]] = tuple(table[i + 1:i + DECODED])
+        table.release()
+        offset += 8 * DECODED * decoded_count
+
+        self.bigints = {}
+        for _ in range(bigint_count):
+            index, length = BIGINT.unpack_from(self.mmap, offset)
+            offset += BIGINT.size
+            self.bigints[index] = int.from_bytes(self.mmap[offset:offset + length], 'little', signed=True)
+            offset += length
+
+
+    def __len__(self):
+        return len(self.cells)
+
+
+    def __getitem__(self, address):
+        if address in self.bigints:
+            return self.bigints[address]
+        return self.cells[address]
+
+
+    def __iter__(self):
+        return iter(self.values())
+
+
+    def values(self):
+        values = self.cells.tolist()
+        for index, value in self.bigints.items():
+            values[index] = value
+        return values
+
+
+    def memory(self):
+        if self.bigints:
+            return Memory(self.values())
+        memory = Memory()
+        memory.cells = self.cells
+        memory.owns_cells = False
+        return memory
+
+
+    # Memories and programs made from the image must be gone before it is
+    # closed, since they may still be using the mapped cells
+    def close(self):
+        self.cells.release()
+        self.mmap.close()
+
+
+# Path of the image for a text input, in the output directory next to the
+# input directory, converting the input if the image is missing or older
+def convert_input(text_path, output_dir=None):
+    if output_dir is None:
+        output_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(text_path))), 'output')
+    name = os.path.splitext(os.path.basename(text_path))[0]
+    path = os.path.join(output_dir, f'{name}.img')
+
+    if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(text_path):
+        with open(text_path) as f:
+            write_image(path, parse_program(f.readline()))
+    return path
+
+
+def load_input(text_path, output_dir=None):
+    return ProgramImage(convert_input(text_path, output_dir))
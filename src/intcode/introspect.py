@@ -0,0 +1,87 @@
+from .analysis import Analysis
+from .opcodes import OUTPUT, MODE_SWITCH, IMMEDIATE_MODE
+
+
+# A grid the program keeps row by row in its memory, read in place so that
+# it always shows the current state without copying or any output
+class GridView:
+    def __init__(self, program, base, width, height):
+        self.program = program
+        self.base = base
+        self.width = width
+        self.height = height
+
+
+    def __getitem__(self, coords):
+        x, y = coords
+        return self.program.memory[self.base + y * self.width + x]
+
+
+    def row(self, y):
+        start = self.base + y * self.width
+        return self.program.memory.cells[start:start + self.width]
+
+
+    def count(self, value):
+        return sum(self.row(y).count(value) for y in range(self.height))
+
+
+    def find(self, value):
+        for y in range(self.height):
+            row = self.row(y)
+            if value in row:
+                return row.index(value), y
+        return None
+
+
+# Finds where the program keeps the grid it drew as cells, a dict of
+# (x, y): value, assuming it is stored row by row with no padding. Returns
+# a GridView, or None if no part of memory matches.
+def find_grid(program, cells):
+    width = max(x for x, _ in cells) + 1
+    height = max(y for _, y in cells) + 1
+    memory = program.memory
+    items = list(cells.items())
+    for base in range(len(memory) - width * height + 1):
+        if all(memory[base + y * width + x] == value for (x, y), value in items):
+            return GridView(program, base, width, height)
+    return None
+
+
+# Narrows down which cell holds a value the host can see, such as the ball
+# position in an output, by keeping only the cells that held the value it
+# had every time it was observed
+class CellFinder:
+    def __init__(self):
+        self.candidates = None
+
+
+    def observe(self, program, value):
+        cells = program.memory.cells
+        if self.candidates is None:
+            self.candidates = [address for address, cell in enumerate(cells) if cell == value]
+        else:
+            self.candidates = [address for address in self.candidates if cells[address] == value]
+
+
+    # The address once only one cell is left
+    @property
+    def address(self):
+        if self.candidates is not None and len(self.candidates) == 1:
+            return self.candidates[0]
+        return None
+
+
+# Rewrites every output instruction Analysis finds into arb 0, a no-op of
+# the same length, for a host that reads what it needs from memory and
+# would otherwise only throw the outputs away. That includes outputs such
+# as a score, so the host has to know where to read those as well. Returns
+# the addresses.
+def silence_outputs(program, analysis=None):
+    if analysis is None:
+        analysis = Analysis(list(program.memory.cells))
+    addresses = [address for address, instruction in analysis.instructions.items() if instruction[0] == OUTPUT]
+    for address in addresses:
+        program.store(address, MODE_SWITCH + 100 * IMMEDIATE_MODE)
+        program.store(address + 1, 0)
+    return addresses
@@ -0,0 +1,163 @@
+from .opcodes import (
+    ADD, LESS_THAN, EQUALS, JUMP_IF_FALSE, IMMEDIATE_MODE, RELATIVE_MODE,
+)
+
+# Closed forms for counted loops: a loop body of nothing but
+#
+#     add x step x
+#
+# updates, where every step is an immediate or a cell the loop never
+# writes, followed by a jump back to the start of the loop either on one
+# of the x or on the result of a single compare of an x against such an
+# invariant bound:
+#
+#     lt x bound flag
+#     jnz flag start
+#
+# Each x then grows by the same amount every iteration, so the number of
+# iterations until the loop exits and every cell's final value can be
+# worked out without running it. Cells are (mode, value) pairs, and since
+# the body cannot change the relative base they name the same address in
+# every iteration.
+
+
+# Returns a description of the loop made of body and the jump back to its
+# start, or None if it is not a counted loop. The description is plain
+# tuples so that it can be written into compiled source.
+def counted_loop(body, jump):
+    jump_op, condition_mode, condition_value = jump[:3]
+    if condition_mode == IMMEDIATE_MODE:
+        return None
+    condition = (condition_mode, condition_value)
+
+    updates = []
+    compare = None
+    written = set()
+    for index, (op, m1, v1, m2, v2, m3, v3, _) in enumerate(body):
+        target = (m3, v3)
+        if target in written:
+            return None
+        written.add(target)
+
+        if op == ADD and (m1, v1) == target:
+            updates.append((target, (m2, v2), index))
+        elif op == ADD and (m2, v2) == target:
+            updates.append((target, (m1, v1), index))
+        elif (op == LESS_THAN or op == EQUALS) and compare is None:
+            compare = (op, (m1, v1), (m2, v2), target, index)
+        else:
+            return None
+
+    steps = {target: step for target, step, _ in updates}
+    for step in steps.values():
+        if step in written:
+            return None
+
+    if compare is None:
+        # Jumping on x itself, as in a countdown: continue while x != 0
+        if condition not in steps:
+            return None
+        op, x, bound, flag, read_at = EQUALS, condition, (IMMEDIATE_MODE, 0), None, len(body)
+        x_on_left = True
+        continue_if = jump_op == JUMP_IF_FALSE
+    else:
+        op, left, right, flag, read_at = compare
+        if flag != condition or flag in (left, right):
+            return None
+        if left in steps and right not in written:
+            x, bound, x_on_left = left, right, True
+        elif right in steps and left not in written:
+            x, bound, x_on_left = right, left, False
+        else:
+            return None
+        continue_if = jump_op != JUMP_IF_FALSE
+
+    # Where each x is read by the compare, relative to its value when the
+    # iteration started
+    offset = next(1 if index < read_at else 0 for target, _, index in updates if target == x)
+    return (
+        tuple((target, step) for target, step, _ in updates),
+        (op, x, offset, bound, x_on_left, flag, continue_if),
+    )
+
+
+# The first iteration (from 0) after which the loop exits, when the
+# compared x is start + step * i in iteration i, or None if it never does
+def exit_iteration(op, start, step, bound, continue_if):
+    if op == EQUALS:
+        if continue_if:
+            if start != bound:
+                return 0
+            return 1 if step != 0 else None
+        if start == bound:
+            return 0
+        if step == 0 or (bound - start) % step or (bound - start) // step < 0:
+            return None
+        return (bound - start) // step
+
+    if continue_if:
+        if start >= bound:
+            return 0
+        if step <= 0:
+            return None
+        return (bound - start + step - 1) // step
+    if start < bound:
+        return 0
+    if step >= 0:
+        return None
+    return (start - bound) // -step + 1
+
+
+# Runs the loop described by loop to completion on memory by applying its
+# closed form, returning False without changing anything if it cannot:
+# when cells alias each other, would write code, or the loop never exits.
+def fast_forward(memory, code_cells, rb, loop):
+    updates, (op, x, offset, bound, x_on_left, flag, continue_if) = loop
+
+    cells = {}
+    for target, step in updates:
+        cells[target] = None
+        if step[0] != IMMEDIATE_MODE:
+            cells[step] = None
+    if bound[0] != IMMEDIATE_MODE:
+        cells[bound] = None
+    if flag is not None:
+        cells[flag] = None
+
+    addresses = set()
+    for cell in cells:
+        mode, value = cell
+        address = rb + value if mode == RELATIVE_MODE else value
+        if address < 0 or address in addresses:
+            return False
+        addresses.add(address)
+        cells[cell] = address
+    for target, _ in updates:
+        if cells[target] in code_cells:
+            return False
+    if flag is not None and cells[flag] in code_cells:
+        return False
+
+    def value_of(cell):
+        return cell[1] if cell[0] == IMMEDIATE_MODE else memory[cells[cell]]
+
+    step = value_of(dict(updates)[x])
+    start = memory[cells[x]] + step * offset
+    bound_value = value_of(bound)
+    if not x_on_left:
+        # bound < x is -x < -bound
+        start, step, bound_value = -start, -step, -bound_value
+
+    last = exit_iteration(op, start, step, bound_value, continue_if)
+    if last is None:
+        return False
+
+    iterations = last + 1
+    values = [(cells[target], memory[cells[target]] + value_of(step) * iterations) for target, step in updates]
+    if flag is not None:
+        compared = start + step * last
+        result = compared < bound_value if op == LESS_THAN else compared == bound_value
+        values.append((cells[flag], 1 if result else 0))
+    for address, value in values:
+        memory[address] = value
+    return True
@@ -0,0 +1,301 @@
+from collections import OrderedDict
+
+from .opcodes import (
+    ADD, MULTIPLY, INPUT, OUTPUT, JUMP_IF_TRUE, JUMP_IF_FALSE, LESS_THAN,
+    MODE_SWITCH, EXIT, IMMEDIATE_MODE, RELATIVE_MODE,
+)
+from .program import Program, HALTED, BLOCKED, OUTPUT_READY, PREEMPTED
+
+
+# A call in progress. reads holds the cells it read before writing them,
+# as address: (read relative to rb, value), and writes the last value it
+# wrote to each cell, both including everything its own callees did.
+class Frame:
+    __slots__ = ('entry', 'cell', 'base', 'signature', 'values', 'work', 'reads', 'writes', 'pure')
+
+
+    def __init__(self, entry, cell, base, signature, values, work):
+        self.entry = entry
+        self.cell = cell
+        self.base = base
+        self.signature = signature
+        self.values = values
+        self.work = work
+        self.reads = {}
+        self.writes = {}
+        self.pure = True
+
+
+    def copy(self):
+        frame = Frame(self.entry, self.cell, self.base, self.signature, self.values, self.work)
+        frame.reads = dict(self.reads)
+        frame.writes = dict(self.writes)
+        frame.pure = self.pure
+        return frame
+
+
+# An engine memoizing calls to pure subroutines, as lru_cache would for a
+# recursive Python function. Calls and returns are recognised as they run,
+# with the same idiom Analysis looks for: an immediate return address
+# written to a relative cell just before an unconditional jump to an
+# immediate target, and a jump back through that cell.
+#
+# A call is pure if it does no I/O and only writes relative to the relative
+# base at or above the cell holding its return address, ie. its own frame
+# and those of its callees. Writes by address are impure even inside the
+# frame, since a hit at another relative base would replay them to the
+# wrong cell.
+# Its result is every cell it wrote and how far it moved the relative
+# base, keyed by the entry address and the values of every cell it read
+# before writing: cells read relative to the relative base as offsets from
+# it at the call, anything else by address. Entries that are ever impure,
+# or that touch more than max_frame_cells cells, are not tried again.
+#
+# Every instruction runs through Python level bookkeeping, so this is
+# several times slower than Program when calls do not repeat.
+class MemoizingProgram(Program):
+    fuse = False
+
+
+    def __init__(self, memory, input=None, max_entries=65536, max_frame_cells=4096):
+        super().__init__(memory, input)
+        self.memo = OrderedDict()
+        self.max_entries = max_entries
+        self.max_frame_cells = max_frame_cells
+        self.signatures = {}
+        self.impure = set()
+        self.frames = []
+        self.work = 0
+        self.hits = 0
+        self.misses = 0
+        self.instructions_skipped = 0
+
+
+    # The fork carries on any calls in progress with its own copy of what
+    # they have recorded, and starts with its own copy of the cache
+    def fork(self, input=None):
+        program = super().fork(input)
+        program.memo = OrderedDict(self.memo)
+        program.signatures = dict(self.signatures)
+        program.impure = set(self.impure)
+        program.frames = [frame.copy() for frame in self.frames]
+        return program
+
+
+    def _invalidate(self, address):
+        # Cached calls ran the code as it was
+        super()._invalidate(address)
+        self.memo.clear()
+        for frame in self.frames:
+            frame.pure = False
+
+
+    def _impure(self):
+        for frame in self.frames:
+            frame.pure = False
+
+
+    def _record_read(self, address, relative, value):
+        frame = self.frames[-1]
+        if frame.pure and address not in frame.writes and address not in frame.reads:
+            frame.reads[address] = (relative, value)
+            if len(frame.reads) + len(frame.writes) > self.max_frame_cells:
+                frame.pure = False
+
+
+    def _record_write(self, address, value):
+        frame = self.frames[-1]
+        if frame.pure:
+            if address < frame.cell:
+                frame.pure = False
+                return
+            frame.writes[address] = value
+            if len(frame.reads) + len(frame.writes) > self.max_frame_cells:
+                frame.pure = False
+
+
+    def load(self, mode, value):
+        if mode == IMMEDIATE_MODE:
+            return value
+        relative = mode == RELATIVE_MODE
+        address = self.relative_base + value if relative else value
+        result = self.memory[address]
+        if self.frames:
+            self._record_read(address, relative, result)
+        return result
+
+
+    def save(self, mode, value, result):
+        if mode != RELATIVE_MODE:
+            self.store(value, result)
+            if self.frames:
+                self._impure()
+            return
+        address = self.relative_base + value
+        self.store(address, result)
+        if self.frames:
+            self._record_write(address, result)
+
+
+    def _call(self, entry, cell):
+        if entry in self.impure:
+            return
+
+        base = self.relative_base
+        signature = self.signatures.get(entry)
+        values = None
+        if signature is not None:
+            try:
+                values = tuple(self.memory[base + n] if relative else self.memory[n] for relative, n in signature)
+            except Exception:
+                values = None
+            key = (entry, signature, values)
+            if values is not None and key in self.memo:
+                self.memo.move_to_end(key)
+                self.hits += 1
+                self._replay(self.memo[key], signature, values, base, cell)
+                return
+        self.misses += 1
+        self.frames.append(Frame(entry, cell, base, signature, values, self.work))
+
+
+    def _replay(self, result, signature, values, base, cell):
+        writes, delta, work = result
+        if self.frames:
+            for (relative, n), value in zip(signature, values):
+                self._record_read(base + n if relative else n, relative, value)
+        for offset, value in writes:
+            self.store(base + offset, value)
+            if self.frames:
+                self._record_write(base + offset, value)
+
+        self.relative_base = base + delta
+        self.position = self.memory[cell]
+        self.work += work
+        self.instructions_skipped += work
+
+
+    def _return(self):
+        frame = self.frames.pop()
+        if frame.pure:
+            self._remember(frame)
+        else:
+            self.impure.add(frame.entry)
+
+        if self.frames:
+            parent = self.frames[-1]
+            if not frame.pure:
+                parent.pure = False
+            elif parent.pure:
+                for address, (relative, value) in frame.reads.items():
+                    self._record_read(address, relative, value)
+                for address, value in frame.writes.items():
+                    self._record_write(address, value)
+
+
+    def _remember(self, frame):
+        reads = {
+            (relative, address - frame.base if relative else address): value
+            for address, (relative, value) in frame.reads.items()
+        }
+        known = dict(zip(frame.signature, frame.values)) if frame.values is not None else {}
+        known.update(reads)
+
+        # A call reading cells earlier calls did not widens the key for
+        # every later call, and the result can only be kept if the value
+        # of every cell in the key at the time of the call is known
+        current = self.signatures.get(frame.entry, ())
+        signature = tuple(sorted(set(current) | reads.keys()))
+        self.signatures[frame.entry] = signature
+        if any(item not in known for item in signature):
+            return
+
+        key = (frame.entry, signature, tuple(known[item] for item in signature))
+        writes = tuple((address - frame.base, value) for address, value in frame.writes.items())
+        self.memo[key] = (writes, self.relative_base - frame.base, self.work - frame.work)
+        self.memo.move_to_end(key)
+        if len(self.memo) > self.max_entries:
+            self.memo.popitem(last=False)
+
+
+    def _run(self, outputs, stop_on_output, budget=-1):
+        self.budget_left = budget
+        call_cell = None
+        while True:
+            if self.budget_left == 0:
+                return PREEMPTED
+            self.budget_left -= 1
+
+            position = self.position
+            instruction = self.decoded.get(position)
+            if instruction is None:
+                instruction = self._decode(position)
+            op, m1, v1, m2, v2, m3, v3, next_position = instruction
+
+            # The return address written by the previous instruction, if
+            # it could have been the first half of a call
+            cell, call_cell = call_cell, None
+
+            if op == EXIT:
+                self.halted = True
+                return HALTED
+
+            if op == INPUT:
+                if self.inputs:
+                    value = self.inputs.popleft()
+                elif self.input is not None:
+                    value = next(self.input)
+                else:
+                    self.budget_left += 1
+                    return BLOCKED
+                self.work += 1
+                self._impure()
+                self.position = next_position
+                self.save(m1, v1, value)
+                continue
+
+            self.work += 1
+            self.position = next_position
+            if op == OUTPUT:
+                self._impure()
+                outputs.append(self.load(m1, v1))
+                if stop_on_output:
+                    return OUTPUT_READY
+            elif op == MODE_SWITCH:
+                self.relative_base += self.load(m1, v1)
+            elif op == JUMP_IF_TRUE or op == JUMP_IF_FALSE:
+                if (self.load(m1, v1) != 0) != (op == JUMP_IF_TRUE):
+                    continue
+                if m2 == RELATIVE_MODE and self.frames and self.relative_base + v2 == self.frames[-1].cell:
+                    # Reading the return address is not part of the call
+                    self.position = self.memory[self.relative_base + v2]
+                    self._return()
+                elif m2 == IMMEDIATE_MODE and cell is not None and cell[1] == next_position:
+                    self.position = v2
+                    self._call(v2, cell[0])
+                else:
+                    self.position = self.load(m2, v2)
+            else:
+                a = self.load(m1, v1)
+                b = self.load(m2, v2)
+                if op == ADD:
+                    result = a + b
+                elif op == MULTIPLY:
+                    result = a * b
+                elif op == LESS_THAN:
+                    result = 1 if a < b else 0
+                else:
+                    result = 1 if a == b else 0
+                self.save(m3, v3, result)
+                if (op == ADD or op == MULTIPLY) and m1 == IMMEDIATE_MODE and m2 == IMMEDIATE_MODE and m3 == RELATIVE_MODE:
+                    call_cell = (self.relative_base + v3, result)
+
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': len(self.memo),
+            'impure_subroutines': len(self.impure),
+            'instructions_skipped': self.instructions_skipped,
+        }
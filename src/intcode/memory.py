@@ -0,0 +1,122 @@
+from array import array
+from copy import copy
+
+PAGE_BITS = 12
+PAGE_SIZE = 1 << PAGE_BITS
+PAGE_MASK = PAGE_SIZE - 1
+
+# Writes further than this past the end of the dense region are stored in
+# sparse pages instead of growing the dense region to reach them
+MAX_DENSE_GAP = 1 << 20
+
+
+def to_cells(values):
+    try:
+        return array('q', values)
+    except OverflowError:
+        return list(values)
+
+
+# Program memory stored contiguously as int64 cells, which are promoted to
+# plain Python ints if a value ever overflows. Addresses far past the end of
+# the program image are kept in a dict of fixed size pages so a single write
+# to a huge address does not allocate everything before it. Reading an
+# address that was never written returns 0 without allocating it.
+#
+# copy() is O(1) in the size of the dense cells: both memories share the
+# cells and pages, and each copies them the first time it writes to them.
+# Sparse pages are copied one page at a time, but the dense cells are
+# copied whole, since paging them would slow down every access in the
+# interpreter loops. Neither side can write in place while the other may
+# still see the cells, so one copy() leads to a full copy of the dense
+# cells in each memory that writes afterwards.
+class Memory:
+    def __init__(self, image=()):
+        self.cells = to_cells(image)
+        self.pages = {}
+        self.sparse_start = None
+        self.owns_cells = True
+        self.owned_pages = set()
+
+
+    def copy(self):
+        other = copy(self)
+        other.pages = dict(self.pages)
+        self.owns_cells = other.owns_cells = False
+        self.owned_pages = set()
+        other.owned_pages = set()
+        return other
+
+
+    def _own_cells(self):
+        # Cells mapped from a program image are a read-only memoryview
+        if isinstance(self.cells, memoryview):
+            self.cells = array('q', self.cells)
+        else:
+            self.cells = self.cells[:]
+        self.owns_cells = True
+
+
+    def __len__(self):
+        return len(self.cells)
+
+
+    def __getitem__(self, address):
+        if address < 0:
+            raise Exception(f'Cannot read negative address {address}')
+        try:
+            return self.cells[address]
+        except IndexError:
+            page = self.pages.get(address >> PAGE_BITS)
+            return 0 if page is None else page[address & PAGE_MASK]
+
+
+    def __setitem__(self, address, value):
+        if address < 0:
+            raise Exception(f'Cannot write negative address {address}')
+        if not self.owns_cells:
+            self._own_cells()
+        try:
+            self.cells[address] = value
+        except IndexError:
+            if self._grow(address):
+                self[address] = value
+            else:
+                self._write_page(address, value)
+        except OverflowError:
+            self.cells = list(self.cells)
+            self.cells[address] = value
+
+
+    def _grow(self, address):
+        size = len(self.cells)
+        if address >= size + MAX_DENSE_GAP:
+            return False
+        if self.sparse_start is not None and address >= self.sparse_start:
+            return False
+
+        # Over-allocate so that stack growth does not extend one cell at a time
+        new_size = max(address + 1, size * 2, PAGE_SIZE)
+        if self.sparse_start is not None:
+            new_size = min(new_size, self.sparse_start)
+        self.cells.extend(to_cells([0]) * (new_size - size))
+        return True
+
+
+    def _write_page(self, address, value):
+        index = address >> PAGE_BITS
+        page = self.pages.get(index)
+        if page is None:
+            page = self.pages[index] = to_cells([0]) * PAGE_SIZE
+            start = index << PAGE_BITS
+            if self.sparse_start is None or start < self.sparse_start:
+                self.sparse_start = start
+            self.owned_pages.add(index)
+        elif index not in self.owned_pages:
+            page = self.pages[index] = page[:]
+            self.owned_pages.add(index)
+        try:
+            page[address & PAGE_MASK] = value
+        except OverflowError:
+            page = self.pages[index] = list(page)
+            page[address & PAGE_MASK] = value
@@ -0,0 +1,334 @@
+from multiprocessing import Process, Queue, shared_memory
+import os
+from queue import Empty
+import time
+import traceback
+
+from .program import Program, BLOCKED, OUTPUT_READY
+
+# Instructions a node runs before its worker moves on to its next node
+QUANTUM = 10_000
+
+# Workers with nothing to do sleep for up to this long between polls
+MAX_IDLE_SLEEP = 0.001
+
+# The shared block starts with control words, followed by the channels:
+#
+#     stop                  set by the coordinator to shut the workers down
+#     drain                 set by the coordinator to break a deadlock
+#     epoch, idle           per worker, see ProcessNetwork.run
+#     halted                per node
+#     head, tail, cells     per channel, head and tail counting values read
+#                           and written since the start
+STOP = 0
+DRAIN = 1
+CONTROL = 2
+
+# Values of a worker's idle word
+BUSY = 0
+IDLE = 1
+STUCK = 2
+
+
+# A single producer, single consumer ring buffer of int64 values in shared
+# memory. Only the producer writes tail and only the consumer writes head,
+# so neither side needs a lock. A value is written before tail is advanced
+# past it, which relies on aligned 8-byte stores being atomic and seen in
+# order by other cores, as they are on x86-64.
+class SharedChannel:
+    def __init__(self, words, offset, capacity, reader):
+        self.words = words
+        # Index of the word set once the reading node has halted
+        self.reader = reader
+        self.head = offset
+        self.tail = offset + 1
+        self.start = offset + 2
+        self.capacity = capacity
+
+
+    def __len__(self):
+        return self.words[self.tail] - self.words[self.head]
+
+
+    def room(self):
+        return self.capacity - len(self)
+
+
+    def put(self, value):
+        tail = self.words[self.tail]
+        try:
+            self.words[self.start + tail % self.capacity] = value
+        except ValueError:
+            raise Exception(f'Value {value} does not fit in a shared channel')
+        self.words[self.tail] = tail + 1
+
+
+    def _read(self, head, tail):
+        first = self.start + head % self.capacity
+        count = tail - head
+        wrapped = first + count - (self.start + self.capacity)
+        if wrapped <= 0:
+            return self.words[first:first + count].tolist()
+        return self.words[first:self.start + self.capacity].tolist() + self.words[self.start:self.start + wrapped].tolist()
+
+
+    def values(self):
+        return self._read(self.words[self.head], self.words[self.tail])
+
+
+    def get(self):
+        head = self.words[self.head]
+        value = self.words[self.start + head % self.capacity]
+        self.words[self.head] = head + 1
+        return value
+
+
+    def take(self):
+        head = self.words[self.head]
+        tail = self.words[self.tail]
+        values = self._read(head, tail)
+        self.words[self.head] = tail
+        return values
+
+
+# Runs the nodes given to one worker process until the coordinator sets
+# stop, then sends back the outputs of its nodes that have no out channels
+def run_worker(index, shm_name, words_count, nodes, results):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    words = shm.buf.cast('q')[:words_count]
+    epoch = CONTROL + 2 * index
+    idle = epoch + 1
+    try:
+        programs = []
+        for name, node_index, memory, engine, inputs, in_channels, out_channels in nodes:
+            program = engine(memory)
+            program.feed(inputs)
+            programs.append((
+                name, node_index, program,
+                [SharedChannel(words, *channel) for channel in in_channels],
+                [SharedChannel(words, *channel) for channel in out_channels],
+                [],
+            ))
+
+        sleep = 0
+        while not words[STOP]:
+            progress = False
+            full = False
+            for name, node_index, program, in_channels, out_channels, outputs in programs:
+                if program.halted:
+                    continue
+                if words[DRAIN]:
+                    # Values normally only cross when the program asks for
+                    # them, but a deadlock on full channels is broken by
+                    # moving everything waiting into the programs
+                    for channel in in_channels:
+                        if len(channel):
+                            words[idle] = BUSY
+                            words[epoch] += 1
+                            program.feed(channel.take())
+                            progress = True
+
+                budget = QUANTUM
+                room = min(channel.room() for channel in out_channels) if out_channels else None
+                while room != 0:
+                    pending = []
+                    status = program._run(pending if out_channels else outputs, bool(out_channels), budget)
+                    budget = program.budget_left
+                    for value in pending:
+                        for channel in out_channels:
+                            channel.put(value)
+                        room -= 1
+                    if status == BLOCKED:
+                        channel = next((channel for channel in in_channels if len(channel)), None)
+                        if channel is None:
+                            break
+                        # Marked busy before the value leaves the channel,
+                        # so the coordinator sees one or the other
+                        words[idle] = BUSY
+                        words[epoch] += 1
+                        program.feed((channel.get(),))
+                        progress = True
+                    elif status != OUTPUT_READY:
+                        break
+                if budget != QUANTUM:
+                    progress = True
+                if room == 0 and any(not channel.room() and not words[channel.reader] for channel in out_channels):
+                    full = True
+                if program.halted:
+                    words[node_index] = 1
+
+            # A node held up by a full channel is stuck rather than idle,
+            # since it will carry on without any new input once the reader
+            # makes room, unless the reader has halted and never will
+            words[idle] = BUSY if progress else STUCK if full else IDLE
+            if progress:
+                sleep = 0
+            else:
+                sleep = min(MAX_IDLE_SLEEP, sleep * 2 or 0.00001)
+                time.sleep(sleep)
+
+        results.put((index, None, {name: outputs for name, _, _, _, _, outputs in programs}))
+    except Exception:
+        results.put((index, traceback.format_exc(), None))
+    finally:
+        words.release()
+        shm.close()
+
+
+# A network of programs like Graph, but with the nodes spread over worker
+# processes so that it can use every core, and every channel a ring buffer
+# in one block of shared memory. Channel values must fit in int64.
+#
+# Nodes are given to workers in contiguous runs in the order they were
+# added, so neighbours in a chain mostly share a worker. Within a worker,
+# nodes take turns for at most QUANTUM instructions each.
+class ProcessNetwork:
+    def __init__(self, workers=None, capacity=1024):
+        self.workers = workers or os.cpu_count() or 1
+        self.capacity = capacity
+        self.nodes = {}
+        self.channels = []
+        self.outputs = {}
+        self.leftovers = []
+
+
+    def add(self, memory, name=None, inputs=(), engine=Program):
+        if name is None:
+            name = len(self.nodes)
+        if name in self.nodes:
+            raise Exception(f'Node {name} already added')
+        self.nodes[name] = (list(memory), engine, list(inputs))
+        return name
+
+
+    # Returns the index of the channel, whose unread values are in
+    # leftovers[index] once run() returns
+    def connect(self, source, target, capacity=None):
+        for name in (source, target):
+            if name not in self.nodes:
+                raise Exception(f'Unknown node {name}')
+        self.channels.append((source, target, capacity or self.capacity))
+        return len(self.channels) - 1
+
+
+    # Runs the network until no node can make progress: every node has
+    # halted or is waiting for input that no other node will send.
+    #
+    # Workers set idle to busy and bump their epoch before taking a value
+    # from a channel. After a pass in which none of their nodes could do
+    # anything, they set it to stuck if a node is waiting for room in a
+    # full channel whose reader has not halted, and to idle otherwise. The
+    # coordinator stops the network once two reads of every epoch, made
+    # before and after checking that every channel is empty or has a halted
+    # reader, are equal and all idle. A value taken from a channel between
+    # the reads moves the reader's epoch, and one taken before the first
+    # read has either been dealt with or left its worker busy.
+    #
+    # Nodes only take a value when they ask for input, so nodes in a cycle
+    # can each end up waiting for room in a full channel to the next. Once
+    # no worker is busy, one is stuck and the epochs have not moved since
+    # the last check, the coordinator sets drain, and workers move all the
+    # values waiting into their programs until some value has been taken.
+    def run(self):
+        names = list(self.nodes)
+        workers = min(self.workers, len(names)) or 1
+        node_index = {name: CONTROL + 2 * workers + i for i, name in enumerate(names)}
+
+        offset = CONTROL + 2 * workers + len(names)
+        offsets = []
+        for _, _, capacity in self.channels:
+            offsets.append(offset)
+            offset += 2 + capacity
+
+        shm = shared_memory.SharedMemory(create=True, size=8 * offset)
+        words = shm.buf.cast('q')[:offset]
+        processes = []
+        try:
+            for i in range(offset):
+                words[i] = 0
+
+            assignments = [[] for _ in range(workers)]
+            for i, name in enumerate(names):
+                memory, engine, inputs = self.nodes[name]
+                in_channels = [
+                    (offsets[c], capacity, node_index[target])
+                    for c, (_, target, capacity) in enumerate(self.channels) if target == name
+                ]
+                out_channels = [
+                    (offsets[c], capacity, node_index[target])
+                    for c, (source, target, capacity) in enumerate(self.channels) if source == name
+                ]
+                assignments[i * workers // len(names)].append(
+                    (name, node_index[name], memory, engine, inputs, in_channels, out_channels)
+                )
+
+            results = Queue()
+            for index, nodes in enumerate(assignments):
+                process = Process(target=run_worker, args=(index, shm.name, offset, nodes, results))
+                process.start()
+                processes.append(process)
+
+            channels = [
+                SharedChannel(words, offsets[c], capacity, node_index[target])
+                for c, (_, target, capacity) in enumerate(self.channels)
+            ]
+            def epochs():
+                return [(words[CONTROL + 2 * i], words[CONTROL + 2 * i + 1]) for i in range(workers)]
+
+            last = None
+            while True:
+                time.sleep(MAX_IDLE_SLEEP)
+                if not all(process.is_alive() for process in processes):
+                    break
+                before = epochs()
+                if words[DRAIN]:
+                    if before != last:
+                        words[DRAIN] = 0
+                    continue
+                if any(idle == BUSY for _, idle in before):
+                    last = None
+                    continue
+                if any(idle == STUCK for _, idle in before):
+                    if before == last:
+                        words[DRAIN] = 1
+                    last = before
+                    continue
+                last = None
+                if any(len(channel) and not words[channel.reader] for channel in channels):
+                    continue
+                if epochs() == before:
+                    break
+
+            words[STOP] = 1
+            errors = []
+            reported = set()
+            while len(reported) < len(processes):
+                running = any(process.is_alive() for i, process in enumerate(processes) if i not in reported)
+                try:
+                    # Anything sent by a worker that has exited is already
+                    # waiting, so only a worker that was killed outright
+                    # never reports back
+                    index, error, outputs = results.get(timeout=0.1 if running else 1)
+                except Empty:
+                    if not running:
+                        raise Exception('Worker exited without reporting back')
+                    continue
+                reported.add(index)
+                if error is not None:
+                    errors.append(error)
+                else:
+                    self.outputs.update({name: values for name, values in outputs.items() if values})
+            for process in processes:
+                process.join()
+            if errors:
+                raise Exception('Worker failed:\n' + errors[0])
+
+            self.leftovers = [channel.values() for channel in channels]
+        finally:
+            words[STOP] = 1
+            for process in processes:
+                process.join()
+            words.release()
+            shm.close()
+            shm.unlink()
+        return self.outputs
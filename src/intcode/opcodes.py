@@ -0,0 +1,83 @@
+ADD = 1
+MULTIPLY = 2
+INPUT = 3
+OUTPUT = 4
+JUMP_IF_TRUE = 5
+JUMP_IF_FALSE = 6
+LESS_THAN = 7
+EQUALS = 8
+MODE_SWITCH = 9
+EXIT = 99
+
+# Superinstructions, only ever made by Program._fuse. Each is an
+# arithmetic or compare op followed by a jump on its result or an
+# unconditional jump, or an immediate relative base change followed by a
+# jump, and its op is FUSED plus the op of the first instruction.
+FUSED = 100
+FUSED_ADD = FUSED + ADD
+FUSED_MULTIPLY = FUSED + MULTIPLY
+FUSED_LESS_THAN = FUSED + LESS_THAN
+FUSED_EQUALS = FUSED + EQUALS
+FUSED_MODE_SWITCH = FUSED + MODE_SWITCH
+
+POSITION_MODE = 0
+IMMEDIATE_MODE = 1
+RELATIVE_MODE = 2
+
+
+PARAM_COUNT = {
+    ADD: 3,
+    MULTIPLY: 3,
+    INPUT: 1,
+    OUTPUT: 1,
+    JUMP_IF_TRUE: 2,
+    JUMP_IF_FALSE: 2,
+    LESS_THAN: 3,
+    EQUALS: 3,
+    MODE_SWITCH: 1,
+    EXIT: 0,
+}
+
+# Params the instruction writes to, which cannot be in immediate mode
+WRITE_PARAMS = {
+    ADD: 2,
+    MULTIPLY: 2,
+    LESS_THAN: 2,
+    EQUALS: 2,
+    INPUT: 0,
+}
+
+MODES = {POSITION_MODE, IMMEDIATE_MODE, RELATIVE_MODE}
+
+JUMPS = {JUMP_IF_TRUE, JUMP_IF_FALSE}
+
+
+# Decodes the instruction at address into a flat tuple of
+# (op, m1, v1, m2, v2, m3, v3, next_address). Unused params are filled in
+# as immediate zeroes so every instruction unpacks the same way.
+def decode(memory, address):
+    raw_op = memory[address]
+    op = raw_op % 100
+    if op not in PARAM_COUNT:
+        raise Exception(f'Invalid ops code {op}, position {address}')
+
+    param_count = PARAM_COUNT[op]
+    modes = raw_op // 100
+    params = []
+    for i in range(3):
+        if i < param_count:
+            mode = modes % 10
+            modes //= 10
+            if mode not in MODES:
+                raise Exception(f'Do not know how to read mode {mode}, position {address}')
+            if mode == IMMEDIATE_MODE and WRITE_PARAMS.get(op) == i:
+                raise Exception(f'Tried to write to immediate param, position {address}')
+            value = memory[address + 1 + i]
+            # A jump target is only read, and so checked, if it is taken
+            if mode == POSITION_MODE and value < 0 and not (op in JUMPS and i == 1):
+                raise Exception(f'Invalid negative address {value}, position {address}')
+            params += [mode, value]
+        else:
+            params += [IMMEDIATE_MODE, 0]
+
+    return (op, *params, address + 1 + param_count)
@@ -0,0 +1,266 @@
+from collections import Counter, defaultdict
+import csv
+import json
+import math
+import time
+
+from .analysis import MNEMONICS, format_instruction
+from .memory import PAGE_BITS, PAGE_SIZE
+from .opcodes import (
+    ADD, MULTIPLY, INPUT, OUTPUT, JUMP_IF_TRUE, JUMP_IF_FALSE, LESS_THAN,
+    MODE_SWITCH, EXIT, IMMEDIATE_MODE, RELATIVE_MODE,
+)
+from .program import Program, HALTED, BLOCKED, OUTPUT_READY, PREEMPTED
+
+
+# Input waits are bucketed by powers of two microseconds
+def wait_bucket(seconds):
+    return max(0, int(seconds * 1_000_000)).bit_length()
+
+
+# An engine recording how often each opcode and address runs, how often
+# each jump is taken, and how long the program waits on input. It is a
+# separate engine rather than a flag on Program, so programs that are not
+# being profiled pay nothing for it.
+class ProfilingProgram(Program):
+    # Counts are per instruction as written
+    fuse = False
+
+
+    def __init__(self, memory, input=None):
+        super().__init__(memory, input)
+        self.op_counts = Counter()
+        self.pc_counts = Counter()
+        self.jumps = defaultdict(lambda: [0, 0])
+        self.input_waits = Counter()
+        self.instructions = {}
+
+
+    def _run(self, outputs, stop_on_output, budget=-1):
+        self.budget_left = budget
+        while True:
+            if self.budget_left == 0:
+                return PREEMPTED
+            self.budget_left -= 1
+
+            position = self.position
+            instruction = self.decoded.get(position)
+            if instruction is None:
+                instruction = self._decode(position)
+            op, m1, v1, m2, v2, m3, v3, next_position = instruction
+
+            if op == INPUT:
+                start = time.perf_counter()
+                if self.inputs:
+                    value = self.inputs.popleft()
+                elif self.input is not None:
+                    value = next(self.input)
+                else:
+                    self.budget_left += 1
+                    return BLOCKED
+                self.input_waits[wait_bucket(time.perf_counter() - start)] += 1
+
+            self.op_counts[op] += 1
+            self.pc_counts[position] += 1
+            self.instructions[position] = instruction
+
+            if op == EXIT:
+                self.halted = True
+                return HALTED
+
+            self.position = next_position
+            if op == INPUT:
+                self.write(m1, v1, value)
+            elif op == OUTPUT:
+                outputs.append(self.read(m1, v1))
+                if stop_on_output:
+                    return OUTPUT_READY
+            elif op == MODE_SWITCH:
+                self.relative_base += self.read(m1, v1)
+            elif op == JUMP_IF_TRUE or op == JUMP_IF_FALSE:
+                taken = (self.read(m1, v1) != 0) == (op == JUMP_IF_TRUE)
+                self.jumps[position][0 if taken else 1] += 1
+                if taken:
+                    self.position = self.read(m2, v2)
+            else:
+                a = self.read(m1, v1)
+                b = self.read(m2, v2)
+                if op == ADD:
+                    result = a + b
+                elif op == MULTIPLY:
+                    result = a * b
+                elif op == LESS_THAN:
+                    result = 1 if a < b else 0
+                else:
+                    result = 1 if a == b else 0
+                self.write(m3, v3, result)
+
+
+    def profile(self):
+        return {
+            'ops': {MNEMONICS[op]: count for op, count in self.op_counts.most_common()},
+            'pcs': {str(pc): count for pc, count in self.pc_counts.most_common()},
+            'jumps': {
+                str(pc): {'taken': taken, 'not_taken': not_taken}
+                for pc, (taken, not_taken) in sorted(self.jumps.items())
+            },
+            'input_waits_us': {
+                f'<{1 << bucket}': count for bucket, count in sorted(self.input_waits.items())
+            },
+        }
+
+
+    def dump_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.profile(), f, indent=2)
+
+
+    # Disassembly of every instruction that ran, in address order, with how
+    # many times it ran and its share of all instructions run
+    def annotated_disassembly(self):
+        total = sum(self.pc_counts.values()) or 1
+        lines = []
+        for pc in sorted(self.instructions):
+            count = self.pc_counts[pc]
+            line = f'{count:>12} {100 * count / total:6.2f}%  {pc:>6}: {format_instruction(self.instructions[pc])}'
+            if pc in self.jumps:
+                taken, not_taken = self.jumps[pc]
+                line += f'  ; taken {taken}, not taken {not_taken}'
+            lines.append(line)
+        return '\n'.join(lines)
+
+
+# Heatmap cells each stand for a run of 64 addresses, so a page is one line
+BUCKET_BITS = 6
+SHADES = ' .:-=+*#%@'
+
+
+# A profiling engine that also records every data read and write: how far
+# apart the lowest and highest addresses touched are, reads and writes per
+# run of addresses, the range addressed relative to the relative base (the
+# stack), and how many cells past the program image were read without ever
+# being written. Memory returns 0 for those without storing anything, but a
+# dict-backed memory would have allocated every one of them.
+class MemoryProfilingProgram(ProfilingProgram):
+    def __init__(self, memory, input=None):
+        super().__init__(memory, input)
+        self.image_size = len(self.memory)
+        self.bucket_reads = Counter()
+        self.bucket_writes = Counter()
+        self.low = self.high = None
+        self.stack_low = self.stack_high = None
+        self.base_low = self.base_high = None
+        self.written = set()
+        self.read_unwritten = set()
+
+
+    def _access(self, address, relative, write):
+        if write:
+            self.bucket_writes[address >> BUCKET_BITS] += 1
+        else:
+            self.bucket_reads[address >> BUCKET_BITS] += 1
+
+        if self.low is None:
+            self.low = self.high = address
+        else:
+            self.low = min(self.low, address)
+            self.high = max(self.high, address)
+        if relative:
+            if self.stack_low is None:
+                self.stack_low = self.stack_high = address
+                self.base_low = self.base_high = self.relative_base
+            else:
+                self.stack_low = min(self.stack_low, address)
+                self.stack_high = max(self.stack_high, address)
+                self.base_low = min(self.base_low, self.relative_base)
+                self.base_high = max(self.base_high, self.relative_base)
+
+        if address >= self.image_size:
+            if write:
+                self.written.add(address)
+            elif address not in self.written:
+                self.read_unwritten.add(address)
+
+
+    def read(self, mode, value):
+        result = super().read(mode, value)
+        if mode != IMMEDIATE_MODE:
+            relative = mode == RELATIVE_MODE
+            self._access(self.relative_base + value if relative else value, relative, False)
+        return result
+
+
+    def write(self, mode, value, result):
+        super().write(mode, value, result)
+        relative = mode == RELATIVE_MODE
+        self._access(self.relative_base + value if relative else value, relative, True)
+
+
+    # Reads and writes per page, keyed by page number
+    def page_counts(self):
+        pages = defaultdict(lambda: [0, 0])
+        for bucket, count in self.bucket_reads.items():
+            pages[bucket >> (PAGE_BITS - BUCKET_BITS)][0] += count
+        for bucket, count in self.bucket_writes.items():
+            pages[bucket >> (PAGE_BITS - BUCKET_BITS)][1] += count
+        return dict(sorted(pages.items()))
+
+
+    def memory_profile(self):
+        return {
+            'image_size': self.image_size,
+            'lowest_address': self.low,
+            'highest_address': self.high,
+            'addressed_range': 0 if self.low is None else self.high - self.low + 1,
+            'dense_cells': len(self.memory.cells),
+            'sparse_pages': len(self.memory.pages),
+            'stack': {
+                'lowest_address': self.stack_low,
+                'highest_address': self.stack_high,
+                'lowest_relative_base': self.base_low,
+                'highest_relative_base': self.base_high,
+            },
+            'cells_written_past_image': len(self.written),
+            'cells_read_but_never_written': len(self.read_unwritten - self.written),
+            'pages': {
+                str(page << PAGE_BITS): {'reads': reads, 'writes': writes}
+                for page, (reads, writes) in self.page_counts().items()
+            },
+        }
+
+
+    def profile(self):
+        profile = super().profile()
+        profile['memory'] = self.memory_profile()
+        return profile
+
+
+    # One line per page touched, one character per 64 addresses, shaded by
+    # how often they were read or written on a log scale
+    def heatmap(self):
+        counts = self.bucket_reads + self.bucket_writes
+        most = max(counts.values(), default=0)
+        scale = (len(SHADES) - 1) / math.log(most + 1) if most else 0
+        # Rounding can put the busiest bucket just past the last shade
+        last = len(SHADES) - 1
+        lines = []
+        for page, (reads, writes) in self.page_counts().items():
+            first = page << (PAGE_BITS - BUCKET_BITS)
+            row = ''.join(
+                SHADES[min(last, math.ceil(math.log(counts[bucket] + 1) * scale))]
+                for bucket in range(first, first + (PAGE_SIZE >> BUCKET_BITS))
+            )
+            lines.append(f'{page << PAGE_BITS:>12} |{row}| reads {reads}, writes {writes}')
+        return '\n'.join(lines)
+
+
+    # One row per run of 64 addresses that was touched
+    def dump_csv(self, path):
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['start', 'end', 'reads', 'writes'])
+            for bucket in sorted(set(self.bucket_reads) | set(self.bucket_writes)):
+                writer.writerow([
+                    bucket << BUCKET_BITS, (bucket + 1) << BUCKET_BITS,
+                    self.bucket_reads[bucket], self.bucket_writes[bucket],
+                ])
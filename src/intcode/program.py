@@ -0,0 +1,425 @@
+from collections import deque, namedtuple
+from copy import copy
+import inspect
+from itertools import tee
+import textwrap
+
+from .memory import Memory
+from .opcodes import (
+    ADD, MULTIPLY, INPUT, OUTPUT, JUMP_IF_TRUE, JUMP_IF_FALSE, LESS_THAN,
+    EQUALS, MODE_SWITCH, EXIT, FUSED, FUSED_ADD, FUSED_MULTIPLY,
+    FUSED_LESS_THAN, FUSED_EQUALS, FUSED_MODE_SWITCH, IMMEDIATE_MODE,
+    RELATIVE_MODE, decode,
+)
+
+
+Snapshot = namedtuple('Snapshot', ['memory', 'position', 'relative_base', 'decoded', 'covers', 'inputs'])
+
+# Why _run stopped
+HALTED = 0
+BLOCKED = 1
+OUTPUT_READY = 2
+PREEMPTED = 3
+
+
+class Program:
+    # Engines overriding _run without handling superinstructions turn this off
+    fuse = True
+
+
+    def __init__(self, memory, input=None):
+        self.memory = memory.copy() if isinstance(memory, Memory) else Memory(memory)
+        self.position = 0
+        self.relative_base = 0
+        self.halted = False
+
+        # Values given to feed() are used first, then the input iterator
+        self.inputs = deque()
+        self.input = input
+
+        # Decoded instructions keyed by address, and the instruction start
+        # address for every cell a decoded instruction was read from. These
+        # are shared with forks until either side changes them.
+        self.decoded = {}
+        self.covers = {}
+        self.owns_decoded = True
+
+
+    def snapshot(self):
+        self.owns_decoded = False
+        return Snapshot(
+            self.memory.copy(), self.position, self.relative_base, self.decoded, self.covers, tuple(self.inputs)
+        )
+
+
+    @classmethod
+    def restore(cls, snapshot, input=None):
+        program = cls([], input)
+        program.memory = snapshot.memory.copy()
+        program.position = snapshot.position
+        program.relative_base = snapshot.relative_base
+        if cls.fuse:
+            program.decoded = snapshot.decoded
+            program.covers = snapshot.covers
+            program.owns_decoded = False
+        program.inputs.extend(snapshot.inputs)
+        return program
+
+
+    # Starts a program from a ProgramImage, sharing its mapped cells and
+    # taking the image's decode table as already decoded instructions
+    @classmethod
+    def from_image(cls, image, input=None):
+        program = cls(image.memory(), input)
+        for address, instruction in sorted(image.decoded.items()):
+            if any(cell in program.covers for cell in range(address, instruction[-1])):
+                continue
+            if program.fuse:
+                instruction = program._fuse(address, instruction)
+            for cell in range(address, instruction[-1]):
+                program.covers[cell] = address
+            program.decoded[address] = instruction
+        return program
+
+
+    # Returns an independent copy of the program in its current state. Unless
+    # a new input is given, both programs receive the rest of the input.
+    def fork(self, input=None):
+        if input is None and self.input is not None:
+            self.input, input = tee(self.input)
+
+        program = copy(self)
+        program.memory = self.memory.copy()
+        program.inputs = deque(self.inputs)
+        program.input = input
+        self.owns_decoded = program.owns_decoded = False
+        return program
+
+
+    def _own_decoded(self):
+        self.decoded = dict(self.decoded)
+        self.covers = dict(self.covers)
+        self.owns_decoded = True
+
+
+    def _decode(self, address):
+        if not self.owns_decoded:
+            self._own_decoded()
+        instruction = decode(self.memory, address)
+        if self.fuse:
+            instruction = self._fuse(address, instruction)
+        for cell in range(address, instruction[-1]):
+            # Only one decoding is kept for each cell, so drop any other
+            # instruction that overlaps this one
+            if self.covers.get(cell, address) != address:
+                self._invalidate(cell)
+            self.covers[cell] = address
+        self.decoded[address] = instruction
+        return instruction
+
+
+    # Fuses the instruction at address with the jump after it when that is
+    # a common pair, returning the superinstruction or the instruction as
+    # it was. A superinstruction covers the cells of both instructions.
+    def _fuse(self, address, instruction):
+        op, m1, v1, m2, v2, m3, v3, next_address = instruction
+        if next_address in self.decoded:
+            # Something jumps straight to the second instruction
+            return instruction
+        if op in (ADD, MULTIPLY, LESS_THAN, EQUALS) or (op == MODE_SWITCH and m1 == IMMEDIATE_MODE):
+            try:
+                jump = decode(self.memory, next_address)
+            except Exception:
+                return instruction
+        else:
+            return instruction
+
+        jump_op, jump_m1, jump_v1, jump_m2, jump_v2, _, _, end = jump
+        if jump_op != JUMP_IF_TRUE and jump_op != JUMP_IF_FALSE:
+            return instruction
+
+        if op == MODE_SWITCH:
+            # Fold the relative base change into the jump's relative params
+            if jump_m1 == RELATIVE_MODE:
+                jump_v1 += v1
+            if jump_m2 == RELATIVE_MODE:
+                jump_v2 += v1
+            return (FUSED + op, jump_m1, jump_v1, jump_m2, jump_v2, jump_op, v1, end)
+
+        # The jump has to be on the result just written, or unconditional,
+        # and to a known target
+        if jump_m2 != IMMEDIATE_MODE:
+            return instruction
+        if jump_m1 == IMMEDIATE_MODE:
+            if (jump_v1 != 0) != (jump_op == JUMP_IF_TRUE):
+                return instruction
+            taken_if = None
+        elif jump_m1 == m3 and jump_v1 == v3:
+            taken_if = jump_op == JUMP_IF_TRUE
+        else:
+            return instruction
+        return (FUSED + op, m1, v1, m2, v2, m3, (v3, taken_if, jump_v2), end)
+
+
+    def _invalidate(self, address):
+        if not self.owns_decoded:
+            self._own_decoded()
+        start = self.covers.pop(address)
+        instruction = self.decoded.pop(start, None)
+        if instruction is not None:
+            for cell in range(start, instruction[-1]):
+                if self.covers.get(cell) == start:
+                    del self.covers[cell]
+
+
+    def read(self, mode, value):
+        if mode == IMMEDIATE_MODE:
+            return value
+        if mode == RELATIVE_MODE:
+            return self.memory[self.relative_base + value]
+        return self.memory[value]
+
+
+    def write(self, mode, value, result):
+        self.store(self.relative_base + value if mode == RELATIVE_MODE else value, result)
+
+
+    def store(self, address, result):
+        self.memory[address] = result
+        if address in self.covers:
+            self._invalidate(address)
+
+
+    def feed(self, values):
+        self.inputs.extend(values)
+
+
+    # Runs until the program halts or needs input that it does not have,
+    # returning everything it output on the way
+    def run_until_blocked(self):
+        outputs = []
+        self._run(outputs, False)
+        return outputs
+
+
+    def run(self, inputs=()):
+        self.feed(inputs)
+        return self.run_until_blocked()
+
+
+    # Runs the program as a generator of its outputs, pausing after each one
+    # so the caller can react before the program reads its next input
+    def execute(self):
+        while True:
+            outputs = []
+            status = self._run(outputs, True)
+            yield from outputs
+            if status == HALTED:
+                return
+            if status == BLOCKED:
+                raise Exception(f'Program is waiting for input, position {self.position}')
+
+
+    # Runs at most max_instructions instructions, returning the status and
+    # the outputs. The number of instructions left over is in budget_left.
+    # A superinstruction counts as one.
+    def step(self, max_instructions):
+        outputs = []
+        status = self._run(outputs, False, max_instructions)
+        return status, outputs
+
+
+    # The interpreter loop. Outputs are appended to outputs, and the loop
+    # returns HALTED, BLOCKED when there is no input left, OUTPUT_READY
+    # after each output if stop_on_output is set, or PREEMPTED once it has
+    # run budget instructions. A negative budget never runs out.
+    def _run(self, outputs, stop_on_output, budget=-1):
+        if budget >= 0:
+            return self._run_budgeted(outputs, stop_on_output, budget)
+        return self._run_unbudgeted(outputs, stop_on_output, budget)
+
+
+    # Runs without a budget use _run_unbudgeted, made from this with the
+    # lines marked budget left out, so that they do not pay for counting
+    # every instruction
+    def _run_budgeted(self, outputs, stop_on_output, budget):
+        memory = self.memory
+        cells = memory.cells
+        owns_cells = memory.owns_cells
+        decoded = self.decoded
+        covers = self.covers
+        inputs = self.inputs
+        position = self.position
+        relative_base = self.relative_base
+
+        while True:
+            if budget == 0:  # budget
+                status = PREEMPTED  # budget
+                break  # budget
+            budget -= 1  # budget
+
+            instruction = decoded.get(position)
+            if instruction is None:
+                instruction = self._decode(position)
+                decoded = self.decoded
+                covers = self.covers
+            op, m1, v1, m2, v2, m3, v3, next_position = instruction
+
+            if op == EXIT:
+                self.halted = True
+                status = HALTED
+                break
+
+            if op == INPUT:
+                if inputs:
+                    value = inputs.popleft()
+                elif self.input is not None:
+                    # Only move past the instruction once there is a value,
+                    # so an input that raises leaves the program resumable
+                    self.position = position
+                    self.relative_base = relative_base
+                    value = next(self.input)
+                else:
+                    budget += 1  # budget
+                    status = BLOCKED
+                    break
+
+                self.relative_base = relative_base
+                self.write(m1, v1, value)
+                position = next_position
+                cells = memory.cells
+                owns_cells = memory.owns_cells
+                decoded = self.decoded
+                covers = self.covers
+                continue
+
+            # Reads go straight to the dense cells, only falling back to the
+            # memory object past the end of them. Position mode params are
+            # checked to be non-negative when decoded, apart from jump
+            # targets, which are only read if the jump is taken.
+            if m1 != IMMEDIATE_MODE:
+                if m1 == RELATIVE_MODE:
+                    v1 += relative_base
+                    if v1 < 0:
+                        raise Exception(f'Cannot read negative address {v1}')
+                try:
+                    v1 = cells[v1]
+                except IndexError:
+                    v1 = memory[v1]
+
+            if op == OUTPUT:
+                outputs.append(v1)
+                position = next_position
+                if stop_on_output:
+                    status = OUTPUT_READY
+                    break
+                continue
+
+            if op == MODE_SWITCH:
+                relative_base += v1
+                position = next_position
+                continue
+
+            if op == JUMP_IF_TRUE or op == JUMP_IF_FALSE or op == FUSED_MODE_SWITCH:
+                # A FUSED_MODE_SWITCH has the jump op in m3, and its jump
+                # params already include the change in v3
+                if (v1 != 0) == ((m3 if op == FUSED_MODE_SWITCH else op) == JUMP_IF_TRUE):
+                    if m2 != IMMEDIATE_MODE:
+                        if m2 == RELATIVE_MODE:
+                            v2 += relative_base
+                        if v2 < 0:
+                            raise Exception(f'Cannot read negative address {v2}')
+                        try:
+                            v2 = cells[v2]
+                        except IndexError:
+                            v2 = memory[v2]
+                    position = v2
+                else:
+                    position = next_position
+                if op == FUSED_MODE_SWITCH:
+                    relative_base += v3
+                continue
+
+            if m2 != IMMEDIATE_MODE:
+                if m2 == RELATIVE_MODE:
+                    v2 += relative_base
+                    if v2 < 0:
+                        raise Exception(f'Cannot read negative address {v2}')
+                try:
+                    v2 = cells[v2]
+                except IndexError:
+                    v2 = memory[v2]
+
+            if op == ADD:
+                result = v1 + v2
+            elif op == MULTIPLY:
+                result = v1 * v2
+            elif op == LESS_THAN:
+                result = 1 if v1 < v2 else 0
+            elif op == EQUALS:
+                result = 1 if v1 == v2 else 0
+            else:
+                if op == FUSED_LESS_THAN:
+                    result = 1 if v1 < v2 else 0
+                elif op == FUSED_EQUALS:
+                    result = 1 if v1 == v2 else 0
+                elif op == FUSED_ADD:
+                    result = v1 + v2
+                else:
+                    result = v1 * v2
+                v3, taken_if, target = v3
+                if taken_if is None or (result != 0) == taken_if:
+                    next_position = target
+
+            address = v3 + relative_base if m3 == RELATIVE_MODE else v3
+            if address < 0:
+                raise Exception(f'Cannot write negative address {address}')
+            if owns_cells:
+                try:
+                    cells[address] = result
+                except (IndexError, OverflowError):
+                    memory[address] = result
+                    cells = memory.cells
+            else:
+                memory[address] = result
+                cells = memory.cells
+                owns_cells = True
+            if address in covers:
+                # A superinstruction that wrote over its own jump goes
+                # back to run the jump as it now is
+                if op > FUSED and covers[address] == position:
+                    next_position = instruction[-1] - 3
+                self._invalidate(address)
+                decoded = self.decoded
+                covers = self.covers
+            position = next_position
+
+        self.position = position
+        self.relative_base = relative_base
+        self.budget_left = budget
+        return status
+
+
+# Compiles a copy of method called name, without the lines ending in
+# # budget. They are blanked rather than removed so that tracebacks show
+# the right lines.
+def without_budget(method, name):
+    try:
+        lines, first = inspect.getsourcelines(method)
+    except OSError:
+        # No source to copy, so runs without a budget count anyway
+        return method
+    source = '\n' * (first - 1) + textwrap.dedent(''.join(
+        '\n' if line.rstrip().endswith('# budget') else line for line in lines
+    ))
+    source = source.replace(f'def {method.__name__}(', f'def {name}(', 1)
+    namespace = {}
+    exec(compile(source, inspect.getsourcefile(method), 'exec'), method.__globals__, namespace)
+    return namespace[name]
+
+
+Program._run_unbudgeted = without_budget(Program._run_budgeted, '_run_unbudgeted')
+
+
+def parse_program(input_str):
+    return list(map(int, input_str.split(',')))
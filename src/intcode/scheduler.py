@@ -0,0 +1,107 @@
+from collections import deque
+import time
+
+from .program import HALTED, BLOCKED, PREEMPTED
+
+READY = 'ready'
+PARKED = 'parked'
+DONE = 'halted'
+
+
+class Process:
+    def __init__(self, name, program, on_output):
+        self.name = name
+        self.program = program
+        self.on_output = on_output
+        self.outputs = []
+        self.state = READY
+        self.instructions = 0
+        self.seconds = 0.0
+        self.slices = 0
+
+
+# Runs many programs in one thread, each in turn for at most quantum
+# instructions, so that a program stuck in a long computation cannot starve
+# the others. Programs waiting for input are parked until send() gives them
+# some, and run() returns once every program is parked or halted, which is
+# when the network as a whole is idle.
+#
+# Outputs from each slice go to on_output(name, values) if it was given
+# when the program was added, which may send() them on to other programs,
+# or are otherwise collected in the process's outputs.
+class Scheduler:
+    def __init__(self, quantum=10_000):
+        self.quantum = quantum
+        self.processes = {}
+        self.ready = deque()
+
+
+    def add(self, program, name=None, on_output=None):
+        if name is None:
+            name = len(self.processes)
+        if name in self.processes:
+            raise Exception(f'Program {name} already added')
+        self.processes[name] = Process(name, program, on_output)
+        self.ready.append(name)
+        return name
+
+
+    def send(self, name, values):
+        process = self.processes[name]
+        process.program.feed(values)
+        if process.state == PARKED:
+            process.state = READY
+            self.ready.append(name)
+
+
+    def idle(self):
+        return not self.ready
+
+
+    # Runs until the network is idle, or for at most max_slices slices. Each
+    # slice is one program running until it is preempted, blocks or halts.
+    def run(self, max_slices=None):
+        slices = 0
+        while self.ready and (max_slices is None or slices < max_slices):
+            slices += 1
+            process = self.processes[self.ready.popleft()]
+            program = process.program
+
+            start = time.perf_counter()
+            status, outputs = program.step(self.quantum)
+            process.seconds += time.perf_counter() - start
+            process.instructions += self.quantum - program.budget_left
+            process.slices += 1
+
+            # Set before passing the outputs on, so a program sent its own
+            # outputs back is woken up again
+            if status == HALTED:
+                process.state = DONE
+            elif status == BLOCKED:
+                process.state = PARKED
+
+            if outputs:
+                if process.on_output is not None:
+                    process.on_output(process.name, outputs)
+                else:
+                    process.outputs += outputs
+
+            if status == PREEMPTED:
+                self.ready.append(process.name)
+
+
+    # Instructions, seconds and the share of each that every program has had
+    def stats(self):
+        instructions = sum(process.instructions for process in self.processes.values()) or 1
+        seconds = sum(process.seconds for process in self.processes.values()) or 1
+        return {
+            name: {
+                'state': process.state,
+                'slices': process.slices,
+                'instructions': process.instructions,
+                'seconds': process.seconds,
+                'instruction_share': process.instructions / instructions,
+                'cpu_share': process.seconds / seconds,
+            }
+            for name, process in self.processes.items()
+        }
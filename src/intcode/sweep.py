@@ -0,0 +1,60 @@
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from itertools import islice
+import os
+
+from .image import ProgramImage
+from .program import Program
+
+# Program image for the worker process, set once when the worker starts so
+# it is not sent along with every chunk
+worker_image = None
+
+
+# memory is the program itself, or the path of a program image file, which
+# every worker then maps instead of being sent a copy
+def init_worker(memory):
+    global worker_image
+    worker_image = ProgramImage(memory).memory() if isinstance(memory, str) else memory
+
+
+def run_chunk(reducer, chunk):
+    return [(inputs, reducer(worker_image, *inputs)) for inputs in chunk]
+
+
+def run_outputs(memory, *inputs):
+    return list(Program(memory, iter(inputs)).execute())
+
+
+# Runs reducer(memory, *inputs) for every tuple of inputs in input_space
+# across a pool of worker processes, yielding (inputs, result) pairs as
+# chunks finish, which is not necessarily the order of input_space. The
+# reducer must be picklable, ie. a module level function. If until is given,
+# the sweep stops at the first result for which until(result) is true.
+#
+# Only a few chunks per worker are queued at a time, so input_space can be
+# a lazy iterator over a very large space.
+def sweep(memory, input_space, reducer=run_outputs, until=None, chunk_size=64, max_workers=None):
+    max_workers = max_workers or os.cpu_count() or 1
+    input_space = iter(input_space)
+    executor = ProcessPoolExecutor(max_workers, initializer=init_worker, initargs=(memory,))
+
+    pending = set()
+    def submit():
+        chunk = list(islice(input_space, chunk_size))
+        if chunk:
+            pending.add(executor.submit(run_chunk, reducer, chunk))
+
+    try:
+        for _ in range(max_workers * 2):
+            submit()
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                for inputs, result in future.result():
+                    yield inputs, result
+                    if until is not None and until(result):
+                        return
+                submit()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,348 @@
+from array import array
+from collections import Counter, namedtuple
+import mmap
+import struct
+
+from .analysis import MNEMONICS
+from .opcodes import (
+    ADD, MULTIPLY, INPUT, OUTPUT, JUMP_IF_TRUE, JUMP_IF_FALSE, LESS_THAN,
+    MODE_SWITCH, EXIT, IMMEDIATE_MODE, RELATIVE_MODE,
+)
+from .program import Program, HALTED, BLOCKED, OUTPUT_READY, PREEMPTED
+
+# A trace is a flat run of int64 cells: a header followed by a ring of
+# fixed size records. The header holds the magic number, the capacity in
+# records and the total number of records ever written, so the newest
+# record is always at index (total - 1) % capacity.
+MAGIC = 0x4943545243  # 'ICTRC'
+HEADER = 4
+RECORD = 5
+NO_ADDRESS = -1
+
+# Most records TracingProgram collects before copying them into the buffer
+FLUSH = 4096
+
+INT64_MIN = -(1 << 63)
+INT64_MASK = (1 << 64) - 1
+
+Record = namedtuple('Record', ['pc', 'op', 'a', 'b', 'address'])
+
+
+# Values too large for int64 are stored wrapped to 64 bits
+def to_int64(value):
+    return ((value - INT64_MIN) & INT64_MASK) + INT64_MIN
+
+
+class TraceBuffer:
+    def __init__(self, capacity=1 << 16, path=None):
+        size = HEADER + capacity * RECORD
+        self.capacity = capacity
+        self.mmap = None
+        if path is None:
+            self.cells = array('q', bytes(8 * size))
+        else:
+            with open(path, 'w+b') as f:
+                f.truncate(8 * size)
+                self.mmap = mmap.mmap(f.fileno(), 8 * size)
+            self.cells = memoryview(self.mmap).cast('q')
+
+        self.cells[0] = MAGIC
+        self.cells[1] = capacity
+        self.cells[2] = 0
+
+
+    # Appends a flat list of records, keeping only the newest capacity of
+    # them
+    def extend(self, values):
+        capacity = self.capacity
+        count = len(values) // RECORD
+        total = self.cells[2]
+        if count > capacity:
+            values = values[(count - capacity) * RECORD:]
+            total += count - capacity
+            count = capacity
+
+        start = total % capacity
+        first = min(count, capacity - start)
+        self._pack(HEADER + start * RECORD, values[:first * RECORD])
+        if first < count:
+            self._pack(HEADER, values[first * RECORD:])
+        self.cells[2] = total + count
+
+
+    def _pack(self, index, values):
+        try:
+            struct.pack_into(f'{len(values)}q', self.cells, 8 * index, *values)
+        except struct.error:
+            struct.pack_into(f'{len(values)}q', self.cells, 8 * index, *map(to_int64, values))
+
+
+    @property
+    def total(self):
+        return self.cells[2]
+
+
+    def flush(self):
+        if self.mmap is not None:
+            self.mmap.flush()
+
+
+    def close(self):
+        if self.mmap is not None:
+            self.cells.release()
+            self.mmap.close()
+            self.mmap = None
+
+
+# Records (pc, op, a, b, address) for every instruction into a TraceBuffer.
+# a and b are the values the instruction worked on (operands, the input or
+# output value, or the jump condition and the position it went to) and
+# address is the cell written, or -1. Once the buffer is full the oldest
+# records are overwritten, so the trace always holds the most recent
+# instructions.
+#
+# Full tracing runs at about half the speed of Program. With sample set
+# above 1, only the first FLUSH instructions in every FLUSH * sample are
+# recorded and the rest run through Program's loop, which brings the cost
+# down to that of running unfused, at the price of gaps in the trace.
+class TracingProgram(Program):
+    # Every instruction gets its own record
+    fuse = False
+
+
+    def __init__(self, memory, input=None, trace=None, sample=1):
+        super().__init__(memory, input)
+        self.trace = trace if trace is not None else TraceBuffer()
+        self.sample = sample
+        # Instructions run so far in the current FLUSH * sample
+        self.sampled = 0
+
+
+    # Runs in chunks of at most FLUSH instructions. Each record is added to
+    # a flat list in one call, and the list is packed into the buffer in
+    # bulk at the end of each chunk, which keeps writes to the buffer off
+    # the path of every instruction.
+    def _run(self, outputs, stop_on_output, budget=-1):
+        period = FLUSH * self.sample
+        pending = []
+        try:
+            while True:
+                traced = self.sampled < FLUSH
+                chunk = (FLUSH if traced else period) - self.sampled
+                if 0 <= budget < chunk:
+                    chunk = budget
+                if traced:
+                    status = self._run_chunk(outputs, stop_on_output, chunk, pending)
+                    self._flush(pending)
+                else:
+                    status = super()._run(outputs, stop_on_output, chunk)
+                self.sampled = (self.sampled + chunk - self.budget_left) % period
+                if budget >= 0:
+                    budget -= chunk - self.budget_left
+                if status != PREEMPTED or budget == 0:
+                    self.budget_left = budget
+                    return status
+        finally:
+            self._flush(pending)
+
+
+    def _flush(self, pending):
+        if pending:
+            self.trace.extend(pending)
+            pending.clear()
+
+
+    # Mirrors Program._run_budgeted, recording each instruction once it
+    # has run
+    def _run_chunk(self, outputs, stop_on_output, budget, pending):
+        memory = self.memory
+        cells = memory.cells
+        owns_cells = memory.owns_cells
+        decoded = self.decoded
+        covers = self.covers
+        inputs = self.inputs
+        position = self.position
+        relative_base = self.relative_base
+        record = pending.extend
+
+        while True:
+            if budget == 0:
+                status = PREEMPTED
+                break
+            budget -= 1
+
+            instruction = decoded.get(position)
+            if instruction is None:
+                instruction = self._decode(position)
+                decoded = self.decoded
+                covers = self.covers
+            op, m1, v1, m2, v2, m3, v3, next_position = instruction
+
+            if op == EXIT:
+                record((position, op, 0, 0, NO_ADDRESS))
+                self.halted = True
+                status = HALTED
+                break
+
+            if op == INPUT:
+                if inputs:
+                    value = inputs.popleft()
+                elif self.input is not None:
+                    # The input can look at the trace so far
+                    self.position = position
+                    self.relative_base = relative_base
+                    self._flush(pending)
+                    value = next(self.input)
+                else:
+                    budget += 1
+                    status = BLOCKED
+                    break
+
+                self.relative_base = relative_base
+                address = v1 + relative_base if m1 == RELATIVE_MODE else v1
+                self.store(address, value)
+                record((position, op, value, 0, address))
+                position = next_position
+                cells = memory.cells
+                owns_cells = memory.owns_cells
+                decoded = self.decoded
+                covers = self.covers
+                continue
+
+            if m1 != IMMEDIATE_MODE:
+                if m1 == RELATIVE_MODE:
+                    v1 += relative_base
+                    if v1 < 0:
+                        raise Exception(f'Cannot read negative address {v1}')
+                try:
+                    v1 = cells[v1]
+                except IndexError:
+                    v1 = memory[v1]
+
+            if op == OUTPUT:
+                record((position, op, v1, 0, NO_ADDRESS))
+                outputs.append(v1)
+                position = next_position
+                if stop_on_output:
+                    status = OUTPUT_READY
+                    break
+                continue
+
+            if op == MODE_SWITCH:
+                record((position, op, v1, 0, NO_ADDRESS))
+                relative_base += v1
+                position = next_position
+                continue
+
+            if op == JUMP_IF_TRUE or op == JUMP_IF_FALSE:
+                # Jump targets are only read if the jump is taken
+                if (v1 != 0) == (op == JUMP_IF_TRUE):
+                    if m2 != IMMEDIATE_MODE:
+                        if m2 == RELATIVE_MODE:
+                            v2 += relative_base
+                        if v2 < 0:
+                            raise Exception(f'Cannot read negative address {v2}')
+                        try:
+                            v2 = cells[v2]
+                        except IndexError:
+                            v2 = memory[v2]
+                else:
+                    v2 = next_position
+                record((position, op, v1, v2, NO_ADDRESS))
+                position = v2
+                continue
+
+            if m2 != IMMEDIATE_MODE:
+                if m2 == RELATIVE_MODE:
+                    v2 += relative_base
+                    if v2 < 0:
+                        raise Exception(f'Cannot read negative address {v2}')
+                try:
+                    v2 = cells[v2]
+                except IndexError:
+                    v2 = memory[v2]
+
+            if op == ADD:
+                result = v1 + v2
+            elif op == MULTIPLY:
+                result = v1 * v2
+            elif op == LESS_THAN:
+                result = 1 if v1 < v2 else 0
+            else:
+                result = 1 if v1 == v2 else 0
+
+            address = v3 + relative_base if m3 == RELATIVE_MODE else v3
+            if address < 0:
+                raise Exception(f'Cannot write negative address {address}')
+            if owns_cells:
+                try:
+                    cells[address] = result
+                except (IndexError, OverflowError):
+                    memory[address] = result
+                    cells = memory.cells
+            else:
+                memory[address] = result
+                cells = memory.cells
+                owns_cells = True
+            record((position, op, v1, v2, address))
+            if address in covers:
+                self._invalidate(address)
+                decoded = self.decoded
+                covers = self.covers
+            position = next_position
+
+        self.position = position
+        self.relative_base = relative_base
+        self.budget_left = budget
+        return status
+
+
+class TraceReader:
+    def __init__(self, source):
+        if isinstance(source, TraceBuffer):
+            self.cells = source.cells
+        else:
+            with open(source, 'rb') as f:
+                self.cells = array('q', f.read())
+        if self.cells[0] != MAGIC:
+            raise Exception('Not an Intcode trace')
+        self.capacity = self.cells[1]
+        self.total = self.cells[2]
+
+
+    # Records oldest first
+    def records(self):
+        count = min(self.total, self.capacity)
+        first = self.total - count
+        for i in range(first, self.total):
+            index = HEADER + (i % self.capacity) * RECORD
+            yield Record(*self.cells[index:index + RECORD])
+
+
+    def filter(self, pc=None, op=None, address=None):
+        for record in self.records():
+            if pc is not None and record.pc != pc:
+                continue
+            if op is not None and record.op != op:
+                continue
+            if address is not None and record.address != address:
+                continue
+            yield record
+
+
+    def summary(self, top=10):
+        ops = Counter()
+        pcs = Counter()
+        writes = Counter()
+        for record in self.records():
+            ops[MNEMONICS.get(record.op, record.op)] += 1
+            pcs[record.pc] += 1
+            if record.address != NO_ADDRESS:
+                writes[record.address] += 1
+        return {
+            'total': self.total,
+            'recorded': min(self.total, self.capacity),
+            'ops': dict(ops.most_common()),
+            'hot_pcs': pcs.most_common(top),
+            'hot_writes': writes.most_common(top),
+        }
@@ -0,0 +1,55 @@
+from benchmark import COUNT_LOOP, ECHO, FIBONACCI, SELF_MODIFYING, SQUARES_LOOP
+from intcode import assemble
+
+# Jumps to the target its add just wrote over, which fusion has to notice
+REWRITTEN_JUMP = '''
+      add [sel] t0 [j+2]
+j:    jnz 1 0
+t0:   out 100
+      halt
+t1:   out 101
+      halt
+sel:  data 3
+'''
+
+# The read at patch would be negative, but is made immediate before it runs
+REWRITTEN_NEGATIVE_READ = '''
+       arb 1
+       add 1101 0 [patch]
+patch: add [rb-5] 0 [x]
+       out [x]
+       halt
+x:     data 0
+'''
+
+# Outputs 999, 1000 or 1001 as its input is below, equal to or above 8
+COMPARE_TO_8 = [
+    3, 21, 1008, 21, 8, 20, 1005, 20, 22, 107, 8, 21, 20, 1006, 20, 31,
+    1106, 0, 36, 98, 0, 0, 1002, 21, 125, 20, 4, 20, 1105, 1, 46, 104,
+    999, 1105, 1, 46, 1101, 1000, 1, 20, 4, 20, 1105, 1, 46, 98, 99,
+]
+
+QUINE = [109, 1, 204, -1, 1001, 100, 1, 100, 1008, 100, 16, 101, 1006, 101, 0, 99]
+
+# (name, memory, inputs) for programs every engine should run to the same
+# outputs as Program
+PROGRAMS = [
+    ('count_loop', assemble(COUNT_LOOP.format(n=300)), []),
+    ('squares_loop', assemble(SQUARES_LOOP.format(n=200)), []),
+    ('fibonacci', assemble(FIBONACCI), [12]),
+    ('echo', assemble(ECHO), list(range(1, 20)) + [0]),
+    ('self_modifying', assemble(SELF_MODIFYING.format(n=300)), []),
+    ('rewritten_jump', assemble(REWRITTEN_JUMP), []),
+    ('rewritten_negative_read', assemble(REWRITTEN_NEGATIVE_READ), []),
+    ('untaken_negative_jump', assemble('arb 1\njz 1 [rb-5]\nout 7\nhalt'), []),
+    ('negative_immediates', [1101, -100, 5, 9, 4, 9, 99, 0, 0, 0], []),
+    ('large_numbers', [1102, 34915192, 34915192, 7, 4, 7, 99, 0], []),
+    ('quine', QUINE, []),
+    ('below_8', COMPARE_TO_8, [7]),
+    ('equal_to_8', COMPARE_TO_8, [8]),
+    ('above_8', COMPARE_TO_8, [9]),
+]
+
+
+def ids(programs):
+    return [name for name, _, _ in programs]
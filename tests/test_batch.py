@@ -0,0 +1,29 @@
+import pytest
+
+from intcode import BatchProgram, Program
+
+from programs import COMPARE_TO_8, PROGRAMS, ids
+
+
+def test_negative_immediate_operands():
+    memory = [1101, -100, 5, 9, 4, 9, 99, 0, 0, 0]
+    assert Program(memory).run() == [-95]
+    assert BatchProgram(memory, 2).run() == [[-95], [-95]]
+
+
+def test_huge_negative_immediate_operand():
+    memory = [1101, -8990782049998606993, 0, 9, 4, 9, 99, 0, 0, 0]
+    assert BatchProgram(memory, 3).run() == [Program(memory).run()] * 3
+
+
+@pytest.mark.parametrize('name, memory, inputs', PROGRAMS, ids=ids(PROGRAMS))
+def test_matches_program(name, memory, inputs):
+    batch = BatchProgram(memory, 3, [inputs] * 3)
+    assert batch.run() == [Program(memory).run(inputs)] * 3
+    assert not batch.failed.any()
+
+
+def test_lanes_diverge():
+    inputs = [[value] for value in range(5, 12)]
+    batch = BatchProgram(COMPARE_TO_8, len(inputs), inputs)
+    assert batch.run() == [Program(COMPARE_TO_8).run(values) for values in inputs]
@@ -0,0 +1,14 @@
+from intcode import CompiledProgram, Program, load_checkpoint, save_checkpoint
+
+
+def test_shared_programs_stay_shared(tmp_path):
+    p = Program([3, 0, 4, 0, 99])
+    q = CompiledProgram([104, 5, 99])
+    save_checkpoint(tmp_path / 'state', (p, [p, q], {'q': q}))
+
+    p2, programs, named = load_checkpoint(tmp_path / 'state')
+    assert programs[0] is p2
+    assert named['q'] is programs[1]
+    assert p2 is not programs[1]
+    assert p2.run([7]) == [7]
+    assert named['q'].run() == [5]
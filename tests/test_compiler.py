@@ -0,0 +1,51 @@
+import pytest
+
+from intcode import Analysis, CompiledProgram, Program, assemble
+
+from programs import PROGRAMS, ids
+
+
+def engines(memory):
+    return [CompiledProgram(memory), CompiledProgram(memory, analysis=Analysis(memory))]
+
+
+def test_rewritten_negative_relative_read():
+    # The read at patch would be negative, but is made immediate before it
+    # runs
+    memory = assemble('''
+           arb 1
+           add 1101 0 [patch]
+    patch: add [rb-5] 0 [x]
+           out [x]
+           halt
+    x:     data 0
+    ''')
+    assert Program(memory).run() == [-5]
+    for program in engines(memory):
+        assert program.run() == [-5]
+
+
+def test_negative_relative_read():
+    memory = assemble('''
+        arb 1
+        out [rb-3]
+        halt
+    ''')
+    for program in engines(memory):
+        with pytest.raises(Exception, match='negative address'):
+            program.run()
+
+
+@pytest.mark.parametrize('name, memory, inputs', PROGRAMS, ids=ids(PROGRAMS))
+def test_matches_program(name, memory, inputs):
+    expected = Program(memory).run(inputs)
+    for program in engines(memory):
+        assert program.run(inputs) == expected
+
+    # Budgets that run out part way through blocks and loops
+    for program in engines(memory):
+        program.feed(inputs)
+        outputs = []
+        while not program.halted:
+            outputs += program.step(5)[1]
+        assert outputs == expected
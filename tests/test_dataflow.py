@@ -0,0 +1,124 @@
+from itertools import permutations
+
+import pytest
+
+from intcode import Graph, Program, assemble
+
+from programs import PROGRAMS
+
+FEEDBACK = [
+    3, 26, 1001, 26, -4, 26, 3, 27, 1002, 27, 2, 27, 1, 27, 26, 27, 4, 27,
+    1001, 28, -1, 28, 1005, 28, 6, 99, 0, 0, 5,
+]
+
+ECHO = assemble('''
+loop: in [x]
+      out [x]
+      jz 0 loop
+x:    data 0
+''')
+
+COUNT = assemble('''
+loop: out [i]
+      add [i] 1 [i]
+      lt [i] 5000 [f]
+      jnz [f] loop
+      halt
+i:    data 0
+f:    data 0
+''')
+
+# Writes ten values before reading any back, then outputs their sum
+BURST = assemble('''
+w:    out [i]
+      add [i] 1 [i]
+      lt [i] 10 [f]
+      jnz [f] w
+r:    in [x]
+      add [t] [x] [t]
+      add [i] -1 [i]
+      jnz [i] r
+      out [t]
+      halt
+i:    data 0
+f:    data 0
+x:    data 0
+t:    data 0
+''')
+
+
+def test_feedback_loop():
+    graph = Graph()
+    for i, phase in enumerate([9, 8, 7, 6, 5]):
+        graph.add(Program(FEEDBACK), inputs=[phase, 0] if i == 0 else [phase])
+    for i in range(5):
+        feedback = graph.connect(i, (i + 1) % 5)
+    graph.run()
+    assert feedback.values()[-1] == 139629729
+
+
+def test_inputs_wait_in_channels():
+    queued = []
+
+    class Watched(Program):
+        def _run(self, *args):
+            queued.append(len(self.inputs))
+            return super()._run(*args)
+
+    graph = Graph(capacity=4)
+    graph.add(Program(COUNT))
+    graph.add(Watched(ECHO))
+    graph.add(Watched(ECHO))
+    graph.connect(0, 1)
+    graph.connect(1, 2)
+    graph.run()
+    assert graph.nodes[2].outputs == list(range(5000))
+    assert max(queued) <= 1
+
+
+def test_full_cycle_grows_a_channel():
+    graph = Graph(capacity=2)
+    graph.add(Program(BURST))
+    graph.add(Program(ECHO))
+    graph.add(Program(ECHO))
+    graph.connect(0, 1)
+    graph.connect(1, 0)
+    graph.connect(0, 2)
+    graph.run()
+    assert graph.nodes[2].outputs == Program(BURST).run(range(10))
+
+
+# Runs the amplifiers one after another with plain Programs, as day 7 did
+def feedback_reference(memory, phases):
+    programs = [Program(memory) for _ in phases]
+    for program, phase in zip(programs, phases):
+        program.feed([phase])
+    values = [0]
+    while not programs[-1].halted:
+        for program in programs:
+            values = program.run(values)
+    return values[-1]
+
+
+@pytest.mark.parametrize('phases', list(permutations(range(5, 10)))[::12])
+def test_feedback_loop_matches_program(phases):
+    graph = Graph(capacity=1)
+    for i, phase in enumerate(phases):
+        graph.add(Program(FEEDBACK), inputs=[phase, 0] if i == 0 else [phase])
+    for i in range(5):
+        feedback = graph.connect(i, (i + 1) % 5)
+    graph.run()
+    assert feedback.values()[-1] == feedback_reference(FEEDBACK, phases)
+
+
+def test_programs_match_program():
+    # Each program of the corpus feeds an echo through a channel with room
+    # for one value
+    graph = Graph(capacity=1)
+    for name, memory, inputs in PROGRAMS:
+        graph.add(Program(memory), name, inputs)
+        graph.add(Program(ECHO), (name, 'echo'))
+        graph.connect(name, (name, 'echo'))
+    graph.run()
+    for name, memory, inputs in PROGRAMS:
+        assert graph.nodes[name, 'echo'].outputs == Program(memory).run(inputs)
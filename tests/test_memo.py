@@ -0,0 +1,69 @@
+import pytest
+
+from intcode import MemoizingProgram, Program, assemble
+
+from programs import PROGRAMS, ids
+
+FIBONACCI = '''
+          arb stack
+          in [rb+1]
+          add done 0 [rb+0]
+          jz 0 fib
+    done: out [rb+2]
+          halt
+
+    fib:  lt [rb+1] 2 [rb+3]
+          jz [rb+3] recurse
+          add [rb+1] 0 [rb+2]
+          jz 0 [rb+0]
+    recurse:
+          arb 4
+          add [rb-3] -1 [rb+1]
+          add first 0 [rb+0]
+          jz 0 fib
+    first:
+          add [rb+2] 0 [rb-1]
+          add [rb-3] -2 [rb+1]
+          add second 0 [rb+0]
+          jz 0 fib
+    second:
+          add [rb-1] [rb+2] [rb-2]
+          arb -4
+          jz 0 [rb+0]
+    stack: data 0
+'''
+
+
+def test_forks_interleaved_mid_call():
+    p = MemoizingProgram(assemble(FIBONACCI))
+    p.feed([12])
+    p.step(20)
+    forks = [p.fork(), p.fork()]
+    outputs = [[], []]
+    while not all(fork.halted for fork in forks):
+        for fork, values in zip(forks, outputs):
+            if not fork.halted:
+                values += fork.step(37)[1]
+    assert outputs == [[144], [144]]
+
+
+@pytest.mark.parametrize('name, memory, inputs', PROGRAMS, ids=ids(PROGRAMS))
+def test_matches_program(name, memory, inputs):
+    expected = Program(memory).run(inputs)
+    assert MemoizingProgram(memory).run(inputs) == expected
+
+    # Forks taken every few steps finish the same way as the program
+    program = MemoizingProgram(memory)
+    program.feed(inputs)
+    outputs = []
+    while not program.halted:
+        fork = program.fork()
+        assert outputs + fork.run_until_blocked() == expected
+        outputs += program.step(7)[1]
+    assert outputs == expected
+
+
+@pytest.mark.parametrize('n', range(15))
+def test_fibonacci(n):
+    memory = assemble(FIBONACCI)
+    assert MemoizingProgram(memory).run([n]) == Program(memory).run([n])
@@ -0,0 +1,71 @@
+import pytest
+
+from itertools import permutations
+
+from intcode import CompiledProgram, ProcessNetwork, Program
+
+from programs import PROGRAMS
+from test_dataflow import BURST, COUNT, ECHO, feedback_reference
+
+FEEDBACK = [
+    3, 52, 1001, 52, -5, 52, 3, 53, 1, 52, 56, 54, 1007, 54, 5, 55, 1005, 55,
+    26, 1001, 54, -5, 54, 1105, 1, 12, 1, 53, 54, 53, 1008, 54, 0, 55, 1001,
+    55, 1, 55, 2, 53, 55, 53, 4, 53, 1001, 56, -1, 56, 1005, 56, 6, 99, 0, 0,
+    0, 0, 10,
+]
+
+
+@pytest.mark.parametrize('workers', [1, 2, 5])
+@pytest.mark.parametrize('capacity', [1, 64])
+def test_feedback_loop(workers, capacity):
+    network = ProcessNetwork(workers, capacity)
+    for i, phase in enumerate([9, 7, 8, 5, 6]):
+        network.add(FEEDBACK, inputs=[phase, 0] if i == 0 else [phase])
+    for i in range(5):
+        feedback = network.connect(i, (i + 1) % 5)
+    network.run()
+    assert network.leftovers[feedback] == [18216]
+
+
+@pytest.mark.parametrize('workers', [1, 3])
+def test_chain(workers):
+    network = ProcessNetwork(workers, capacity=4)
+    for memory in (COUNT, ECHO, ECHO):
+        network.add(memory)
+    network.connect(0, 1)
+    network.connect(1, 2)
+    assert network.run()[2] == list(range(5000))
+
+
+@pytest.mark.parametrize('workers', [1, 3])
+def test_full_cycle_is_drained(workers):
+    network = ProcessNetwork(workers, capacity=2)
+    for memory in (BURST, ECHO, ECHO):
+        network.add(memory)
+    network.connect(0, 1)
+    network.connect(1, 0)
+    network.connect(0, 2)
+    assert network.run()[2] == Program(BURST).run(range(10))
+
+
+@pytest.mark.parametrize('phases', list(permutations(range(5, 10)))[::30])
+def test_feedback_loop_matches_program(phases):
+    network = ProcessNetwork(3, capacity=1)
+    for i, phase in enumerate(phases):
+        network.add(FEEDBACK, inputs=[phase, 0] if i == 0 else [phase])
+    for i in range(5):
+        feedback = network.connect(i, (i + 1) % 5)
+    network.run()
+    assert network.leftovers[feedback] == [feedback_reference(FEEDBACK, phases)]
+
+
+@pytest.mark.parametrize('engine', [Program, CompiledProgram])
+def test_programs_match_program(engine):
+    network = ProcessNetwork(3, capacity=1)
+    for name, memory, inputs in PROGRAMS:
+        network.add(memory, name, inputs, engine)
+        network.add(ECHO, (name, 'echo'))
+        network.connect(name, (name, 'echo'))
+    outputs = network.run()
+    for name, memory, inputs in PROGRAMS:
+        assert outputs[name, 'echo'] == Program(memory).run(inputs)
@@ -0,0 +1,18 @@
+import pytest
+
+from intcode import MemoryProfilingProgram, assemble
+from intcode.profiler import SHADES
+
+
+def test_heatmap_busiest_bucket_from_program():
+    p = MemoryProfilingProgram(assemble('    add [i] 1 [i]\n' * 44 + '    out [i]\n    halt\ni: data 0\n'))
+    assert list(p.execute()) == [44]
+    assert SHADES[-1] in p.heatmap()
+
+
+# Counts whose log scale rounds up past the last shade
+@pytest.mark.parametrize('count', [89, 3488, 3673])
+def test_heatmap_busiest_bucket(count):
+    p = MemoryProfilingProgram([99])
+    p.bucket_reads[0] = count
+    assert p.heatmap().split('|')[1][0] == SHADES[-1]
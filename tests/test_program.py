@@ -0,0 +1,72 @@
+import pytest
+
+from intcode import (
+    Analysis, BatchProgram, CompiledProgram, MemoizingProgram, MemoryProfilingProgram,
+    ProfilingProgram, Program, TracingProgram, assemble,
+)
+
+from programs import PROGRAMS, ids
+
+
+def engines(memory):
+    return [
+        Program(memory),
+        CompiledProgram(memory),
+        CompiledProgram(memory, analysis=Analysis(memory)),
+        ProfilingProgram(memory),
+        MemoryProfilingProgram(memory),
+        TracingProgram(memory),
+        MemoizingProgram(memory),
+    ]
+
+
+UNTAKEN = [
+    'jz 1 [-5]',
+    'jnz 0 [-5]',
+    'arb 1\njz 1 [rb-5]',
+]
+
+TAKEN = [
+    'jz 0 [-5]',
+    'jnz 1 [-5]',
+    'arb 1\njz 0 [rb-5]',
+]
+
+
+@pytest.mark.parametrize('jump', UNTAKEN)
+def test_untaken_jump_target_is_not_read(jump):
+    memory = assemble(jump + '\nout 7\nhalt')
+    for program in engines(memory):
+        assert program.run() == [7]
+    batch = BatchProgram(memory, 2)
+    assert batch.run() == [[7], [7]]
+    assert not batch.failed.any()
+
+
+@pytest.mark.parametrize('jump', TAKEN)
+def test_taken_jump_target_is_read(jump):
+    memory = assemble(jump + '\nout 7\nhalt')
+    for program in engines(memory):
+        with pytest.raises(Exception, match='negative address'):
+            program.run()
+    batch = BatchProgram(memory, 2)
+    batch.run()
+    assert batch.failed.all()
+
+
+class Unfused(Program):
+    fuse = False
+
+
+@pytest.mark.parametrize('name, memory, inputs', PROGRAMS, ids=ids(PROGRAMS))
+def test_fusion_matches_unfused(name, memory, inputs):
+    expected = Unfused(memory).run(inputs)
+    assert Program(memory).run(inputs) == expected
+
+    # Stopping every few instructions splits fused pairs' runs at every
+    # possible point
+    program = Program(memory, iter(inputs))
+    outputs = []
+    while not program.halted:
+        outputs += program.step(3)[1]
+    assert outputs == expected
@@ -0,0 +1,56 @@
+from intcode import TraceBuffer, TraceReader, TracingProgram, assemble
+from intcode.trace import FLUSH
+
+
+COUNT = '''
+    loop: add [i] 1 [i]
+          lt [i] {n} [flag]
+          jnz [flag] loop
+          out [i]
+          halt
+    i:    data 0
+    flag: data 0
+'''
+
+
+def test_records_every_instruction():
+    p = TracingProgram(assemble(COUNT.format(n=2000)))
+    assert p.run() == [2000]
+    assert p.trace.total == 3 * 2000 + 2
+    records = list(TraceReader(p.trace).records())
+    assert len(records) == 3 * 2000 + 2
+    assert records[-4:] == [(4, 7, 2000, 2000, 15), (8, 5, 0, 11, -1), (11, 4, 2000, 0, -1), (13, 99, 0, 0, -1)]
+
+
+def test_keeps_newest_records_across_steps():
+    p = TracingProgram(assemble(COUNT.format(n=2000)), trace=TraceBuffer(7))
+    outputs = []
+    while not p.halted:
+        outputs += p.step(1000)[1]
+    assert outputs == [2000]
+    assert [record.pc for record in TraceReader(p.trace).records()] == [4, 8, 0, 4, 8, 11, 13]
+
+
+def test_sample():
+    p = TracingProgram(assemble(COUNT.format(n=5000)), sample=2)
+    assert p.run() == [5000]
+    # The first FLUSH of every 2 * FLUSH instructions are recorded
+    assert p.trace.total == 2 * FLUSH
+
+
+def test_wraps_large_values():
+    p = TracingProgram(assemble('mul 1000000000000 1000000000000 [x]\nout [x]\nhalt\nx: data 0'))
+    assert p.run() == [10 ** 24]
+    record = list(TraceReader(p.trace).records())[1]
+    assert record.a == (10 ** 24 + (1 << 63)) % (1 << 64) - (1 << 63)
+
+
+def test_file_backed(tmp_path):
+    trace = TraceBuffer(16, path=tmp_path / 'trace')
+    p = TracingProgram(assemble(COUNT.format(n=10)), trace=trace)
+    assert p.run() == [10]
+    trace.flush()
+    trace.close()
+    summary = TraceReader(tmp_path / 'trace').summary()
+    assert summary['total'] == 32
+    assert summary['recorded'] == 16